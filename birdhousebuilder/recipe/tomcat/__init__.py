@@ -3,41 +3,282 @@
 """Recipe tomcat"""
 
 import os
+import re
+import glob
 import pwd
+import json
+import shlex
+import shutil
+import zipfile
+import time
+import threading
+import hashlib
 import logging
-from mako.template import Template
-from subprocess import check_call, CalledProcessError
+from multiprocessing.pool import ThreadPool
+from mako.lookup import TemplateLookup
+from subprocess import check_output, CalledProcessError, STDOUT
 
 import zc.buildout
+from zc.buildout.buildout import bool_option
 import zc.recipe.deployment
 from zc.recipe.deployment import Configuration
 from zc.recipe.deployment import make_dir
 import birdhousebuilder.recipe.conda
 from birdhousebuilder.recipe import supervisor
+from birdhousebuilder.recipe.tomcat.war import extract_war
+from birdhousebuilder.recipe.tomcat.sizing import host_resources, auto_size, AUTO_SIZE_OPTIONS
 
-setenv_sh = Template(filename=os.path.join(os.path.dirname(__file__), "setenv.sh"))
-tomcat_users_xml = Template(filename=os.path.join(os.path.dirname(__file__), "tomcat-users.xml"))
-server_xml = Template(filename=os.path.join(os.path.dirname(__file__), "server.xml"))
-logging_props = Template(filename=os.path.join(os.path.dirname(__file__), "logging.properties"))
+TEMPLATES = os.path.dirname(__file__)
 
+# folders of each catalina-base and whether they are owned by the etc-user or the user running tomcat
+LAYOUT = (
+    ('bin', 'etc-user'),
+    ('conf', 'etc-user'),
+    ('logs', 'user'),
+    ('temp', 'user'),
+    ('webapps', 'user'),
+    ('work', 'user'),
+    # java prefs folders
+    # http://stackoverflow.com/questions/15004954/java-setting-preferences-backingstore-directory
+    (os.path.join('java_prefs', '.java'), 'user'),
+    (os.path.join('java_prefs', '.java', '.systemPrefs'), 'user'),
+    (os.path.join('java_prefs', '.java', '.userPrefs'), 'user'),
+)
 
-def unzip(prefix, warfile):
+# ports of each instance shifted by the port-offset: (option, key of the instance)
+INSTANCE_PORTS = (
+    ('http_port', 'http_port'),
+    ('https_port', 'https_port'),
+    ('shutdown_port', 'shutdown_port'),
+    ('ajp_port', 'ajp_port'),
+    ('cluster-receiver-port', 'cluster_receiver_port'),
+    ('jmx-port', 'jmx_port'),
+    ('prometheus-port', 'prometheus_port'),
+)
+
+# number of install steps running concurrently
+PIPELINE_WORKERS = 4
+
+# template lookups are created on first use and shared by all recipe instances
+_lookups = {}
+
+# short names for the connector protocol implementations
+PROTOCOLS = {
+    'http/1.1': 'HTTP/1.1',
+    'nio': 'org.apache.coyote.http11.Http11NioProtocol',
+    'nio2': 'org.apache.coyote.http11.Http11Nio2Protocol',
+    'apr': 'org.apache.coyote.http11.Http11AprProtocol',
+}
+
+# protocol implementations of the TLS connector, NIO and NIO2 use OpenSSL through tcnative
+TLS_PROTOCOLS = {
+    'nio': 'org.apache.coyote.http11.Http11NioProtocol',
+    'nio2': 'org.apache.coyote.http11.Http11Nio2Protocol',
+    'apr': 'org.apache.coyote.http11.Http11AprProtocol',
+}
+
+# compressed by default: capabilities documents, catalogs and json responses
+COMPRESSIBLE_MIME_TYPES = (
+    'text/html', 'text/xml', 'text/plain', 'text/css', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml',
+    'application/vnd.ogc.wms_xml', 'application/vnd.ogc.se_xml',
+)
+
+# settings of a JDBC resource: (setting, attribute of the tomcat jdbc-pool, default), None is required
+JDBC_POOL_SETTINGS = (
+    ('url', 'url', None),
+    ('driver', 'driverClassName', None),
+    ('username', 'username', None),
+    ('password', 'password', ''),
+    ('max-active', 'maxActive', '100'),
+    ('max-idle', 'maxIdle', ''),
+    ('min-idle', 'minIdle', '10'),
+    ('initial-size', 'initialSize', '10'),
+    ('max-wait', 'maxWait', '10000'),
+    ('validation-query', 'validationQuery', 'SELECT 1'),
+    ('validation-interval', 'validationInterval', '30000'),
+    ('test-while-idle', 'testWhileIdle', 'true'),
+    ('test-on-borrow', 'testOnBorrow', 'true'),
+    ('time-between-eviction-runs', 'timeBetweenEvictionRunsMillis', '5000'),
+)
+
+# access log patterns with the request duration (%D), commit time (%F) and thread name (%I)
+ACCESS_LOG_PATTERNS = {
+    'text': '%h %l %u %t "%r" %s %b %D %F %I',
+    'json': '{"time":"%{yyyy-MM-dd\'T\'HH:mm:ss.SSSZ}t","remote":"%a","method":"%m","path":"%U","query":"%q",'
+            '"status":%s,"bytes":%B,"duration":%D,"commit":%F,"thread":"%I"}',
+}
+
+LOG_LEVELS = ('OFF', 'SEVERE', 'WARNING', 'INFO', 'CONFIG', 'FINE', 'FINER', 'FINEST', 'ALL')
+
+# org.apache.juli.AsyncOverflowDropType of the AsyncFileHandler queue
+LOG_OVERFLOW = {'drop-last': '1', 'drop-first': '2', 'flush': '3', 'drop-current': '4'}
+
+JVM_PROFILES = ('', 'throughput', 'low-latency', 'container')
+
+
+def unzip(prefix, warfile, workers=None):
+    """Extracts warfile to the webapps folder in prefix. Only entries changed since the last call are written."""
     warname = os.path.basename(warfile)
     dirname = warname[0:-4]
     dirpath = os.path.join(prefix, 'webapps', dirname)
-    if not os.path.isdir(dirpath):
-        try:
-            check_call(['unzip', '-q', warfile, '-d', dirpath])
-        except CalledProcessError:
-            raise
-        except:
-            raise
+    return extract_war(warfile, dirpath, workers=workers)
+
+
+def conda_package_name(spec):
+    """Returns the package name of a conda package spec, i.e. birdhouse::thredds>=4.6 -> thredds."""
+    return re.split(r'[=<>!~\[ ]', spec.split('::')[-1])[0]
+
+
+def template_lookup(directories, module_directory=None):
+    """Returns the template lookup for directories. Compiled templates are cached in a folder of module_directory
+    named by the digest of directories, as mako only keys the compiled modules by the template filename."""
+    key = (tuple(directories), module_directory)
+    if key not in _lookups:
+        modulename = None
+        if module_directory:
+            digest = hashlib.sha1(repr(tuple(directories)).encode('utf-8')).hexdigest()
+            module_directory = os.path.join(module_directory, digest)
+
+            def modulename(filename, uri):
+                # mako reuses a module newer than the template, a template replaced by an older file
+                # gets a new module named by its modification time and size
+                stat = os.stat(filename)
+                return os.path.join(module_directory, '{0}.{1}-{2}.py'.format(
+                    uri.strip('/'), int(stat.st_mtime * 1000), stat.st_size))
+        _lookups[key] = TemplateLookup(directories=list(directories), module_directory=module_directory,
+                                       modulename_callable=modulename)
+    return _lookups[key]
+
+
+def parse_java_version(text):
+    """Returns the version string of java as (major, update) tuple, i.e. 1.8.0_191 -> (8, 191), 11.0.2 -> (11, 2)."""
+    match = re.match(r'(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:_(\d+))?', text or '')
+    if not match:
+        return None
+    major, minor, micro, update = match.groups()
+    if major == '1' and minor:
+        return (int(minor), int(update or 0))
+    return (int(major), int(micro or 0))
+
+
+def java_version(java_home):
+    """Detects the version of the java installed in java_home. Returns None when no java is found."""
+    release = os.path.join(java_home, 'release')
+    if os.path.isfile(release):
+        with open(release) as fp:
+            for line in fp:
+                if line.startswith('JAVA_VERSION='):
+                    return parse_java_version(line.split('=', 1)[1].strip().strip('"'))
+    java = os.path.join(java_home, 'bin', 'java')
+    if not os.path.isfile(java):
+        return None
+    try:
+        output = check_output([java, '-version'], stderr=STDOUT).decode('utf-8', 'replace')
+    except (OSError, CalledProcessError):
+        return None
+    match = re.search(r'version "([^"]+)"', output)
+    if match:
+        return parse_java_version(match.group(1))
+    return None
+
 
+def supports(version, since=(0, 0), until=None):
+    """Checks if a JVM flag available from since and removed in until is supported by java version.
+    With an unknown version only flags available in java 8 and never removed are used."""
+    if version is None:
+        return since <= (8, 0) and until is None
+    return version >= since and (until is None or version < until)
 
-def make_dirs(name, user, mode=0o755):
-    etc_uid, etc_gid = pwd.getpwnam(user)[2:4]
+
+def java_opts(options, version):
+    """Returns the JVM flags of the jvm-profile which are supported by the given java version."""
+    profile = options['jvm-profile']
+    opts = []
+    if supports(version, until=(10, 0)):
+        opts.append('-d64')
+    ram_percentage = supports(version, (8, 191), (9, 0)) or supports(version, (10, 0))
+    if profile == 'container' and ram_percentage:
+        opts.append('-XX:MaxRAMPercentage={0}'.format(options['MaxRAMPercentage']))
+    else:
+        opts.append('-Xmx{0}'.format(options['Xmx']))
+        opts.append('-Xms{0}'.format(options['Xms']))
+    opts.append('-server')
+    if supports(version, until=(8, 0)):
+        opts.append('-XX:MaxPermSize={0}'.format(options['MaxPermSize']))
+    elif supports(version, (8, 0)):
+        metaspace = options['MaxMetaspaceSize'] or ('512m' if profile else '')
+        if metaspace:
+            opts.append('-XX:MaxMetaspaceSize={0}'.format(metaspace))
+    if profile == 'throughput':
+        opts.append('-XX:+UseParallelGC')
+        opts.append('-XX:+AlwaysPreTouch')
+        if supports(version, (18, 0)):
+            opts.append('-XX:+UseStringDeduplication')
+    elif profile == 'low-latency':
+        if supports(version, (15, 0)):
+            opts.append('-XX:+UseZGC')
+            dedup = supports(version, (18, 0))
+        else:
+            opts.append('-XX:+UseG1GC')
+            opts.append('-XX:MaxGCPauseMillis=200')
+            dedup = supports(version, (8, 20))
+        opts.append('-XX:+AlwaysPreTouch')
+        if dedup:
+            opts.append('-XX:+UseStringDeduplication')
+    elif profile == 'container':
+        opts.append('-XX:+UseG1GC')
+        if supports(version, (8, 20)):
+            opts.append('-XX:+UseStringDeduplication')
+        if supports(version, (8, 92)):
+            opts.append('-XX:+ExitOnOutOfMemoryError')
+    return opts
+
+
+def file_digest(path):
+    """Returns the sha256 digest of the file content or None if the file does not exist."""
+    try:
+        with open(path, 'rb') as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def find_tcnative(directories):
+    """Returns the path of the tcnative library in one of directories or None."""
+    for directory in directories:
+        for pattern in ('libtcnative-1.so*', 'libtcnative-1*.dylib'):
+            found = sorted(glob.glob(os.path.join(directory, pattern)))
+            if found:
+                return found[0]
+    return None
+
+
+def check_int(options, key, minimum=0):
+    try:
+        value = int(options[key])
+    except ValueError:
+        raise zc.buildout.UserError(
+            "Option {0} must be an integer, got {1!r}".format(key, options[key]))
+    if minimum is not None and value < minimum:
+        raise zc.buildout.UserError(
+            "Option {0} must be at least {1}, got {2}".format(key, minimum, value))
+    return value
+
+
+def make_layout(layout, mode=0o755):
+    """Creates the missing folders of layout, a list of (path, user) with parents before children.
+    Each user is only looked up once."""
+    ids = {}
     created = []
-    make_dir(name, etc_uid, etc_gid, mode, created)
+    for path, user in layout:
+        if os.path.isdir(path):
+            continue
+        if user not in ids:
+            ids[user] = pwd.getpwnam(user)[2:4]
+        uid, gid = ids[user]
+        make_dir(path, uid, gid, mode, created)
+    return created
 
 
 class Recipe(object):
@@ -77,124 +318,814 @@ class Recipe(object):
         self.options['cache-directory'] = self.options['cache_directory'] = self.deployment.options['cache-directory']
         self.prefix = self.options['prefix']
 
+        # webapps given by WAR file or by conda package with the WAR file in ${conda-prefix}/webapps
+        self.options['webapps'] = self.options.get('webapps', '')
+        packages = [entry for entry in self.options['webapps'].split() if not entry.endswith('.war')]
+
         # conda packages
         self.options['env'] = self.options.get('env', '')
         self.options['pkgs'] = self.options.get('pkgs', 'apache-tomcat')
         self.options['channels'] = self.options.get('channels', 'defaults birdhouse')
         self.conda = birdhousebuilder.recipe.conda.Recipe(self.buildout, self.name, {
             'env': self.options['env'],
-            'pkgs': self.options['pkgs'],
+            'pkgs': ' '.join([self.options['pkgs']] + packages),
             'channels': self.options['channels']})
         self.options['conda-prefix'] = self.options['conda_prefix'] = self.conda.options['prefix']
 
+        self.webapps = []
+        for entry in self.options['webapps'].split():
+            if entry.endswith('.war'):
+                warfile = entry
+            else:
+                warfile = os.path.join(self.options['conda-prefix'], 'webapps', conda_package_name(entry) + '.war')
+            name = os.path.basename(warfile)[:-4]
+            self.webapps.append({'name': name,
+                                 'warfile': warfile,
+                                 'doc_base': os.path.join(self.options['lib-directory'], 'apps', name)})
+        precompile = bool_option(self.options, 'precompile-jsp', False)
+        self.options['precompile_jsp'] = self.options['precompile-jsp'] = 'true' if precompile else 'false'
+        # threads starting the webapps in parallel, 0 uses all cores
+        self.options['start_stop_threads'] = self.options['start-stop-threads'] = \
+            self.options.get('start-stop-threads', '0')
+        check_int(self.options, 'start-stop-threads', minimum=None)
+        # jar patterns skipped and scanned for TLDs and web-fragments
+        self.options['jar_scan_skip'] = self.options['jar-scan-skip'] = self.options.get('jar-scan-skip', '')
+        self.options['jar_scan_scan'] = self.options['jar-scan-scan'] = self.options.get('jar-scan-scan', '')
+        scan_classpath = bool_option(self.options, 'jar-scan-classpath', True)
+        self.options['jar_scan_classpath'] = self.options['jar-scan-classpath'] = \
+            'true' if scan_classpath else 'false'
+
         # tomcat options
         self.options['catalina_home'] = self.options['catalina-home'] = self.options.get(
             'catalina-home',
             os.path.join(self.options['conda-prefix'], 'opt', 'apache-tomcat'))
         self.options['catalina_base'] = self.options['catalina-base'] = self.options['lib-directory']
 
+        # heap, threads and file descriptors derived from the host resources unless given
+        use_auto_size = bool_option(self.options, 'auto-size', False)
+        self.options['auto_size'] = self.options['auto-size'] = 'true' if use_auto_size else 'false'
+        self.options['auto_size_notes'] = ''
+        if use_auto_size:
+            count = check_int({'instances': self.options.get('instances', '1')}, 'instances', minimum=1)
+            given = dict((key, self.options[key]) for key in AUTO_SIZE_OPTIONS if key in self.options)
+            values, notes = auto_size(host_resources(), count, given)
+            for key, value in sorted(values.items()):
+                self.options[key] = value
+            self.options['auto_size_notes'] = '\n'.join(notes)
+            for note in notes:
+                self.logger.info("auto-size: %s", note)
+        self.options['ulimit_nofile'] = self.options['ulimit-nofile'] = self.options.get('ulimit-nofile', '')
+        if self.options['ulimit-nofile']:
+            check_int(self.options, 'ulimit-nofile', minimum=1)
+
         # java options
         self.options['java_home'] = self.options['java-home'] = \
             self.options.get('java-home', self.options['conda-prefix'])
         self.options['Xmx'] = self.options.get('Xmx', '1024m')
         self.options['Xms'] = self.options.get('Xms', '128m')
         self.options['MaxPermSize'] = self.options.get('MaxPermSize', '128m')
+        self.options['MaxMetaspaceSize'] = self.options.get('MaxMetaspaceSize', '')
+        self.options['MaxRAMPercentage'] = self.options.get('MaxRAMPercentage', '75.0')
+        # a non-blocking entropy source for the session ids
+        self.options['entropy_source'] = self.options['entropy-source'] = \
+            self.options.get('entropy-source', 'file:/dev/./urandom')
+        self.options['jvm_profile'] = self.options['jvm-profile'] = self.options.get('jvm-profile', '')
+        # the java version is detected once at install time
+        self.java_lock = threading.Lock()
+        if self.options['jvm-profile'] not in JVM_PROFILES:
+            raise zc.buildout.UserError(
+                "Unknown jvm-profile {0!r}, use one of {1}".format(
+                    self.options['jvm-profile'], ', '.join(JVM_PROFILES[1:])))
 
         # config options
         self.options['http_port'] = self.options.get('http_port', '8080')
         self.options['https_port'] = self.options.get('https_port', '8443')
+        self.options['shutdown_port'] = self.options.get('shutdown_port', '8005')
+        self.options['ajp_port'] = self.options.get('ajp_port', '8009')
         self.options['ncwms_password'] = self.options.get('ncwms_password', '')
 
-        # make folders
-        make_dirs(os.path.join(self.options['catalina-base'], 'bin'), self.options['etc-user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], 'conf'), self.options['etc-user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], 'logs'), self.options['user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], 'temp'), self.options['user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], 'webapps'), self.options['user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], 'work'), self.options['user'], mode=0o755)
-
-        # prepare java prefs folders
-        # http://stackoverflow.com/questions/15004954/java-setting-preferences-backingstore-directory
-        make_dirs(os.path.join(self.options['catalina-base'], "java_prefs", ".java"),
-                  self.options['user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], "java_prefs", ".java", ".systemPrefs"),
-                  self.options['user'], mode=0o755)
-        make_dirs(os.path.join(self.options['catalina-base'], "java_prefs", ".java", ".userPrefs"),
-                  self.options['user'], mode=0o755)
+        # monitoring options
+        use_jmx = bool_option(self.options, 'jmx', False)
+        self.options['jmx'] = 'true' if use_jmx else 'false'
+        self.options['jmx_port'] = self.options['jmx-port'] = self.options.get('jmx-port', '9010')
+        self.options['jmx_user'] = self.options['jmx-user'] = self.options.get('jmx-user', 'monitorRole')
+        self.options['jmx_password'] = self.options['jmx-password'] = self.options.get('jmx-password', '')
+        if use_jmx and not self.options['jmx-password']:
+            raise zc.buildout.UserError("Option jmx-password is required for jmx.")
+        self.options['prometheus_agent'] = self.options['prometheus-agent'] = self.options.get('prometheus-agent', '')
+        self.options['prometheus_host'] = self.options['prometheus-host'] = \
+            self.options.get('prometheus-host', '127.0.0.1')
+        self.options['prometheus_port'] = self.options['prometheus-port'] = self.options.get('prometheus-port', '9404')
+
+        # access log options
+        use_access_log = bool_option(self.options, 'access-log', True)
+        self.options['access_log'] = self.options['access-log'] = 'true' if use_access_log else 'false'
+        self.options['access_log_format'] = self.options['access-log-format'] = \
+            self.options.get('access-log-format', 'text')
+        if self.options['access-log-format'] not in ACCESS_LOG_PATTERNS:
+            raise zc.buildout.UserError(
+                "Unknown access-log-format {0!r}, use text or json".format(self.options['access-log-format']))
+        self.options['access_log_pattern'] = self.options['access-log-pattern'] = self.options.get(
+            'access-log-pattern', ACCESS_LOG_PATTERNS[self.options['access-log-format']])
+        buffered = bool_option(self.options, 'access-log-buffered', True)
+        self.options['access_log_buffered'] = self.options['access-log-buffered'] = 'true' if buffered else 'false'
+        rotatable = bool_option(self.options, 'access-log-rotatable', True)
+        self.options['access_log_rotatable'] = self.options['access-log-rotatable'] = 'true' if rotatable else 'false'
+
+        # logging options
+        use_async = bool_option(self.options, 'async-logging', False)
+        self.options['async_logging'] = self.options['async-logging'] = 'true' if use_async else 'false'
+        self.options['log_queue_size'] = self.options['log-queue-size'] = self.options.get('log-queue-size', '10000')
+        self.options['log_overflow'] = self.options['log-overflow'] = self.options.get('log-overflow', 'drop-last')
+        self.options['log_level'] = self.options['log-level'] = self.options.get('log-level', 'FINE')
+        for handler in ('catalina', 'localhost', 'manager', 'host-manager'):
+            key = handler + '-log-level'
+            self.options[key.replace('-', '_')] = self.options[key] = self.options.get(key, self.options['log-level'])
+        self.options['log_max_days'] = self.options['log-max-days'] = self.options.get('log-max-days', '')
+        # supervisor already captures the console output in its own log file
+        use_console = bool_option(self.options, 'console-log', False)
+        self.options['console_log'] = self.options['console-log'] = 'true' if use_console else 'false'
+        self.check_logging_options()
+
+        # templates in override directories are used instead of the default templates
+        self.options['template_directories'] = self.options['template-directories'] = \
+            self.options.get('template-directories', '')
+        self.template_directories = self.options['template-directories'].split() + [TEMPLATES]
+
+        # connector options
+        protocol = self.options.get('protocol', 'HTTP/1.1')
+        self.options['protocol'] = PROTOCOLS.get(protocol.lower(), protocol)
+        use_executor = bool_option(self.options, 'executor', False)
+        self.options['executor'] = 'true' if use_executor else 'false'
+        self.options['max_threads'] = self.options['max-threads'] = self.options.get('max-threads', '200')
+        self.options['min_spare_threads'] = self.options['min-spare-threads'] = \
+            self.options.get('min-spare-threads', '10')
+        self.options['max_idle_time'] = self.options['max-idle-time'] = self.options.get('max-idle-time', '60000')
+        self.options['accept_count'] = self.options['accept-count'] = self.options.get('accept-count', '100')
+        self.options['max_connections'] = self.options['max-connections'] = self.options.get('max-connections', '')
+        self.options['connection_timeout'] = self.options['connection-timeout'] = \
+            self.options.get('connection-timeout', '20000')
+        self.options['ajp_max_threads'] = self.options['ajp-max-threads'] = \
+            self.options.get('ajp-max-threads', self.options['max-threads'])
+        self.options['ajp_connection_timeout'] = self.options['ajp-connection-timeout'] = \
+            self.options.get('ajp-connection-timeout', '')
+        self.options['ajp_packet_size'] = self.options['ajp-packet-size'] = self.options.get('ajp-packet-size', '')
+        self.options['ajp_secret'] = self.options['ajp-secret'] = self.options.get('ajp-secret', '')
+        self.options['compression'] = self.options.get('compression', 'off')
+        self.options['compression_min_size'] = self.options['compression-min-size'] = \
+            self.options.get('compression-min-size', '2048')
+        self.options['compressible_mime_types'] = self.options['compressible-mime-types'] = \
+            self.options.get('compressible-mime-types', ','.join(COMPRESSIBLE_MIME_TYPES))
+        self.options['use_sendfile'] = self.options['use-sendfile'] = self.options.get('use-sendfile', '')
+        self.check_connector_options()
+
+        # TLS connector on https_port using OpenSSL of tcnative
+        use_https = bool_option(self.options, 'https', False)
+        self.options['https'] = 'true' if use_https else 'false'
+        https_protocol = self.options.get('https-protocol', 'nio').lower()
+        self.options['https_protocol'] = self.options['https-protocol'] = https_protocol
+        self.options['https_protocol_class'] = TLS_PROTOCOLS.get(https_protocol, '')
+        self.options['ssl_certificate'] = self.options['ssl-certificate'] = self.options.get('ssl-certificate', '')
+        self.options['ssl_certificate_key'] = self.options['ssl-certificate-key'] = \
+            self.options.get('ssl-certificate-key', '')
+        self.options['ssl_certificate_chain'] = self.options['ssl-certificate-chain'] = \
+            self.options.get('ssl-certificate-chain', '')
+        self.options['ssl_protocols'] = self.options['ssl-protocols'] = \
+            self.options.get('ssl-protocols', 'TLSv1.2+TLSv1.3')
+        self.options['ssl_ciphers'] = self.options['ssl-ciphers'] = self.options.get('ssl-ciphers', '')
+        self.options['ssl_session_cache_size'] = self.options['ssl-session-cache-size'] = \
+            self.options.get('ssl-session-cache-size', '20480')
+        self.options['ssl_session_timeout'] = self.options['ssl-session-timeout'] = \
+            self.options.get('ssl-session-timeout', '3600')
+        use_http2 = bool_option(self.options, 'http2', True)
+        self.options['http2'] = 'true' if use_http2 else 'false'
+        self.check_tls_options()
+
+        # static resources cache of the webapps
+        caching_allowed = bool_option(self.options, 'caching-allowed', True)
+        self.options['caching_allowed'] = self.options['caching-allowed'] = 'true' if caching_allowed else 'false'
+        self.options['cache_max_size'] = self.options['cache-max-size'] = self.options.get('cache-max-size', '10240')
+        self.options['cache_ttl'] = self.options['cache-ttl'] = self.options.get('cache-ttl', '5000')
+        check_int(self.options, 'cache-max-size', minimum=1)
+        check_int(self.options, 'cache-ttl')
+
+        # graceful stop: supervisor sends TERM and kills tomcat after stop-timeout seconds
+        self.options['stop_timeout'] = self.options['stop-timeout'] = self.options.get('stop-timeout', '60')
+        self.options['graceful_stop_timeout'] = self.options['graceful-stop-timeout'] = \
+            self.options.get('graceful-stop-timeout', '30')
+        # tomcat only waits gracefulStopAwaitMillis for connectors not bound on init
+        bind_on_init = bool_option(self.options, 'bind-on-init', False)
+        self.options['bind_on_init'] = self.options['bind-on-init'] = 'true' if bind_on_init else 'false'
+        # readiness of an instance, {http_port} is replaced by the port of the instance
+        self.options['health_check_url'] = self.options['health-check-url'] = \
+            self.options.get('health-check-url', 'http://127.0.0.1:{http_port}/')
+        self.options['health_check_timeout'] = self.options['health-check-timeout'] = \
+            self.options.get('health-check-timeout', '120')
+        self.check_graceful_options()
+
+        # cluster options
+        use_cluster = bool_option(self.options, 'cluster', False)
+        self.options['cluster'] = 'true' if use_cluster else 'false'
+        self.options['jvm_route'] = self.options['jvm-route'] = self.options.get('jvm-route', 'jvm')
+        self.options['cluster_host'] = self.options['cluster-host'] = self.options.get('cluster-host', 'localhost')
+        self.options['cluster_nodes'] = self.options['cluster-nodes'] = self.options.get('cluster-nodes', '')
+        self.options['cluster_membership_address'] = self.options['cluster-membership-address'] = \
+            self.options.get('cluster-membership-address', '228.0.0.4')
+        self.options['cluster_membership_port'] = self.options['cluster-membership-port'] = \
+            self.options.get('cluster-membership-port', '45564')
+        self.options['cluster_receiver_port'] = self.options['cluster-receiver-port'] = \
+            self.options.get('cluster-receiver-port', '4000')
+        self.options['cluster_receiver_threads'] = self.options['cluster-receiver-threads'] = \
+            self.options.get('cluster-receiver-threads', '6')
+        self.options['cluster_sender_threads'] = self.options['cluster-sender-threads'] = \
+            self.options.get('cluster-sender-threads', '25')
+        self.options['balancer_name'] = self.options['balancer-name'] = \
+            self.options.get('balancer-name', 'loadbalancer')
+        self.check_cluster_options()
+
+        # JDBC connection pools in GlobalNamingResources linked into the context of each webapp
+        self.options['resources'] = self.options.get('resources', '')
+        self.check_resources_options()
+
+        # instances sharing catalina-home, each with its own catalina-base and ports
+        self.options['instances'] = self.options.get('instances', '1')
+        self.options['port_offset'] = self.options['port-offset'] = self.options.get('port-offset', '10')
+        self.instances = self.make_instances()
+
+    def layout(self):
+        """Returns the folders of all instances as list of (path, user)."""
+        layout = []
+        for instance in self.instances:
+            layout += [(os.path.join(instance['catalina_base'], name), self.options[owner])
+                       for name, owner in LAYOUT]
+            if instance['log_directory'] != self.options['log-directory']:
+                layout.append((instance['log_directory'], self.options['user']))
+        return layout
+
+    def check_logging_options(self):
+        check_int(self.options, 'log-queue-size', minimum=1)
+        if self.options['log-overflow'] not in LOG_OVERFLOW:
+            raise zc.buildout.UserError(
+                "Unknown log-overflow {0!r}, use one of {1}".format(
+                    self.options['log-overflow'], ', '.join(sorted(LOG_OVERFLOW))))
+        self.options['log_overflow_type'] = LOG_OVERFLOW[self.options['log-overflow']]
+        for key in ('log-level', 'catalina-log-level', 'localhost-log-level', 'manager-log-level',
+                    'host-manager-log-level'):
+            if self.options[key] not in LOG_LEVELS:
+                raise zc.buildout.UserError(
+                    "Unknown {0} {1!r}, use one of {2}".format(key, self.options[key], ', '.join(LOG_LEVELS)))
+        if self.options['log-max-days']:
+            check_int(self.options, 'log-max-days', minimum=-1)
+
+    def check_tls_options(self):
+        if self.options['https-protocol'] not in TLS_PROTOCOLS:
+            raise zc.buildout.UserError(
+                "Unknown https-protocol {0!r}, use one of {1}".format(
+                    self.options['https-protocol'], ', '.join(sorted(TLS_PROTOCOLS))))
+        check_int(self.options, 'ssl-session-cache-size')
+        check_int(self.options, 'ssl-session-timeout')
+        if self.options['https'] == 'true':
+            for key in ('ssl-certificate', 'ssl-certificate-key'):
+                if not self.options[key]:
+                    raise zc.buildout.UserError("Option {0} is required with https".format(key))
+
+    def check_graceful_options(self):
+        stop_timeout = check_int(self.options, 'stop-timeout', minimum=1)
+        graceful_stop_timeout = check_int(self.options, 'graceful-stop-timeout')
+        if graceful_stop_timeout >= stop_timeout:
+            raise zc.buildout.UserError(
+                "Option graceful-stop-timeout ({0}) must be less than stop-timeout ({1})".format(
+                    graceful_stop_timeout, stop_timeout))
+        check_int(self.options, 'health-check-timeout', minimum=1)
+        try:
+            self.options['health-check-url'].format(http_port=0)
+        except (KeyError, IndexError, ValueError):
+            raise zc.buildout.UserError(
+                "Option health-check-url may only contain the {{http_port}} placeholder, got {0!r}".format(
+                    self.options['health-check-url']))
+
+    def check_cluster_options(self):
+        check_int(self.options, 'cluster-membership-port', minimum=1)
+        check_int(self.options, 'cluster-receiver-port', minimum=1)
+        check_int(self.options, 'cluster-receiver-threads', minimum=1)
+        check_int(self.options, 'cluster-sender-threads', minimum=1)
+        self.cluster_nodes = []
+        for line in self.options['cluster-nodes'].splitlines():
+            if not line.strip():
+                continue
+            try:
+                jvm_route, host, http_port, ajp_port = line.split()
+                int(http_port), int(ajp_port)
+            except ValueError:
+                raise zc.buildout.UserError(
+                    "Option cluster-nodes expects lines 'jvm-route host http_port ajp_port', got {0!r}".format(line))
+            self.cluster_nodes.append(
+                {'jvm_route': jvm_route, 'host': host, 'http_port': http_port, 'ajp_port': ajp_port})
+
+    def check_resources_options(self):
+        """Parses the resources option, a line 'name setting=value ...' per JDBC resource."""
+        settings = dict((setting, default) for setting, _, default in JDBC_POOL_SETTINGS)
+        self.resources = []
+        for line in self.options['resources'].splitlines():
+            if not line.strip():
+                continue
+            try:
+                words = shlex.split(line)
+                values = dict(word.split('=', 1) for word in words[1:])
+            except ValueError:
+                raise zc.buildout.UserError(
+                    "Option resources expects lines 'name setting=value ...', got {0!r}".format(line))
+            name = words[0]
+            unknown = sorted(key for key in values if key not in settings)
+            if unknown:
+                raise zc.buildout.UserError(
+                    "Unknown settings {0} of resource {1}, use {2}".format(
+                        ', '.join(unknown), name, ', '.join(setting for setting, _, _ in JDBC_POOL_SETTINGS)))
+            for setting, default in settings.items():
+                if default is None and not values.get(setting):
+                    raise zc.buildout.UserError("Setting {0} of resource {1} is required".format(setting, name))
+                values.setdefault(setting, default)
+            if not values['url'].startswith('jdbc:'):
+                raise zc.buildout.UserError("Url of resource {0} must start with jdbc:, got {1!r}".format(
+                    name, values['url']))
+            values['max-idle'] = values['max-idle'] or values['max-active']
+            limits = {}
+            for setting in ('max-active', 'max-idle', 'min-idle', 'initial-size', 'max-wait', 'validation-interval',
+                            'time-between-eviction-runs'):
+                limits[setting] = check_int(values, setting, minimum=-1 if setting == 'max-wait' else 0)
+            if not limits['min-idle'] <= limits['max-idle'] <= limits['max-active']:
+                raise zc.buildout.UserError(
+                    "Resource {0} needs min-idle <= max-idle <= max-active, got {1}, {2} and {3}".format(
+                        name, limits['min-idle'], limits['max-idle'], limits['max-active']))
+            if limits['initial-size'] > limits['max-active']:
+                raise zc.buildout.UserError(
+                    "Setting initial-size ({0}) of resource {1} exceeds max-active ({2})".format(
+                        limits['initial-size'], name, limits['max-active']))
+            for setting in ('test-while-idle', 'test-on-borrow'):
+                if values[setting] not in ('true', 'false'):
+                    raise zc.buildout.UserError(
+                        "Setting {0} of resource {1} must be true or false".format(setting, name))
+            if values['test-while-idle'] == 'true' and not values['validation-query']:
+                raise zc.buildout.UserError(
+                    "Resource {0} needs a validation-query with test-while-idle".format(name))
+            if name in [resource['name'] for resource in self.resources]:
+                raise zc.buildout.UserError("Resource {0} is defined twice".format(name))
+            self.resources.append({
+                'name': name,
+                'driver': values['driver'],
+                'attributes': [(attribute, values[setting]) for setting, attribute, _ in JDBC_POOL_SETTINGS
+                               if values[setting]]})
+
+    def make_instances(self):
+        """Returns the settings of each tomcat instance. A single instance uses the lib-directory as catalina-base,
+        otherwise instance N uses lib-directory/instance-N and its ports are shifted by N-1 times the port-offset."""
+        count = check_int(self.options, 'instances', minimum=1)
+        offset = check_int(self.options, 'port-offset', minimum=1)
+        ports = dict((key, check_int(self.options, key, minimum=1)) for key, _ in INSTANCE_PORTS)
+        # ports of disabled features are not opened and can not collide
+        disabled = set()
+        if self.options['cluster'] != 'true':
+            disabled.add('cluster-receiver-port')
+        if self.options['jmx'] != 'true':
+            disabled.add('jmx-port')
+        if not self.options['prometheus-agent']:
+            disabled.add('prometheus-port')
+        used = {}
+        instances = []
+        for index in range(count):
+            if count == 1:
+                instance = {'part': self.name,
+                            'program': 'tomcat',
+                            'catalina_base': self.options['lib-directory'],
+                            'log_directory': self.options['log-directory']}
+            else:
+                number = index + 1
+                instance = {'part': '{0}-{1}'.format(self.name, number),
+                            'program': 'tomcat-{0}'.format(number),
+                            'catalina_base': os.path.join(self.options['lib-directory'], 'instance-{0}'.format(number)),
+                            'log_directory': os.path.join(self.options['log-directory'], 'instance-{0}'.format(number))}
+            for key, name in INSTANCE_PORTS:
+                port = ports[key] + index * offset
+                instance[name] = str(port)
+                if key in disabled:
+                    continue
+                if port in used:
+                    raise zc.buildout.UserError(
+                        "Port {0} is used by {1} and {2} {3}, change the ports or the port-offset".format(
+                            port, used[port], instance['program'], key))
+                used[port] = '{0} {1}'.format(instance['program'], key)
+            instance['jvm_route'] = '{0}{1}'.format(self.options['jvm-route'], index + 1)
+            instance['health_check_url'] = self.options['health-check-url'].format(http_port=instance['http_port'])
+            instances.append(instance)
+        return instances
+
+    def check_connector_options(self):
+        max_threads = check_int(self.options, 'max-threads', minimum=1)
+        min_spare_threads = check_int(self.options, 'min-spare-threads')
+        if min_spare_threads > max_threads:
+            raise zc.buildout.UserError(
+                "Option min-spare-threads ({0}) exceeds max-threads ({1})".format(min_spare_threads, max_threads))
+        check_int(self.options, 'max-idle-time')
+        check_int(self.options, 'accept-count', minimum=1)
+        check_int(self.options, 'connection-timeout', minimum=-1)
+        if self.options['max-connections']:
+            # -1 disables the connection limit for NIO/NIO2
+            check_int(self.options, 'max-connections', minimum=-1)
+        if self.options['compression'] not in ('on', 'off', 'force'):
+            # a number enables compression above this response size
+            check_int(self.options, 'compression', minimum=1)
+        check_int(self.options, 'compression-min-size')
+        if self.options['use-sendfile'] not in ('', 'true', 'false'):
+            raise zc.buildout.UserError("Option use-sendfile must be true or false")
+        if '.' not in self.options['protocol'] and self.options['protocol'] not in ('HTTP/1.1', 'AJP/1.3'):
+            raise zc.buildout.UserError(
+                "Unknown connector protocol {0!r}, use one of {1}".format(
+                    self.options['protocol'], ', '.join(sorted(PROTOCOLS))))
+
+    def template_path(self, name):
+        for directory in self.template_directories:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+        raise zc.buildout.UserError("Template {0} not found in {1}".format(name, self.template_directories))
+
+    def render(self, filename, **kwargs):
+        """Renders the template filename with the recipe options and additional kwargs."""
+        lookup = template_lookup(self.template_directories,
+                                 os.path.join(self.options['cache-directory'], 'templates'))
+        values = dict((key, self.options[key]) for key in self.options)
+        values.update(kwargs)
+        return lookup.get_template(filename).render(**values)
 
     def install(self, update=False):
+        self.load_digests()
+        self.timings = {}
+        start = time.time()
         installed = []
         if not update:
-            installed += list(self.deployment.install())
-        installed += list(self.conda.install(update))
-        installed += list(self.install_catalina_sh())
-        installed += list(self.install_setenv_sh())
-        installed += list(self.install_web_xml())
-        installed += list(self.install_tomcat_users_xml())
-        installed += list(self.install_server_xml())
-        installed += list(self.install_logging_props())
-        installed += list(self.install_supervisor(update))
+            installed += list(self.timed('deployment', self.deployment.install))
+        self.timed('layout', make_layout, self.layout())
+        # owner of the files written by the install steps
+        self.user_ids = pwd.getpwnam(self.options['user'])[2:4]
+        pool = ThreadPool(PIPELINE_WORKERS)
+        try:
+            # only the conda installation is slow, the templates do not depend on it
+            conda = pool.apply_async(self.timed, ('conda', self.conda.install, update))
+            steps = []
+            for instance in self.instances:
+                for step in (self.install_tomcat_users_xml, self.install_context_xml, self.install_server_xml,
+                             self.install_logging_props, self.install_monitoring):
+                    steps.append(pool.apply_async(self.timed, (self.step_name(step, instance), step, instance)))
+            if self.options['cluster'] == 'true':
+                steps.append(pool.apply_async(self.timed, ('balancer', self.install_balancer)))
+            steps.append(pool.apply_async(self.timed, ('restart_script', self.install_restart_script)))
+            installed += list(conda.get())
+            if self.options['https'] == 'true':
+                self.timed('tls', self.check_tls)
+            if self.resources:
+                self.timed('jdbc_drivers', self.check_jdbc_drivers)
+            if self.webapps:
+                steps.append(pool.apply_async(self.timed, ('webapps', self.install_webapps)))
+            # catalina.sh, web.xml and the java version come from the conda environment
+            for instance in self.instances:
+                for step in (self.install_catalina_sh, self.install_web_xml, self.install_setenv_sh):
+                    steps.append(pool.apply_async(self.timed, (self.step_name(step, instance), step, instance)))
+            for result in steps:
+                installed += list(result.get())
+        finally:
+            pool.close()
+            pool.join()
+        for instance in self.instances:
+            installed += list(self.timed(self.step_name(self.install_supervisor, instance),
+                                         self.install_supervisor, instance, update))
+        self.save_digests()
+        self.logger.info("Installed tomcat in %.2fs (slowest steps: %s)", time.time() - start,
+                         ', '.join('{0} {1:.2f}s'.format(step, seconds) for step, seconds in
+                                   sorted(self.timings.items(), key=lambda item: -item[1])[:3]))
+        self.restart_needed = bool(self.changed)
+        if self.restart_needed:
+            self.logger.info("Tomcat configuration changed (%s), tomcat needs a restart.",
+                             ', '.join(os.path.relpath(path, self.options['prefix']) for path in sorted(self.changed)))
+        else:
+            self.logger.info("Tomcat configuration unchanged, no restart needed.")
         return installed
 
-    def install_catalina_sh(self):
+    def timed(self, step, func, *args):
+        """Calls func with args and records the time taken by the install step."""
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.timings[step] = time.time() - start
+            self.logger.debug("%s took %.3fs", step, self.timings[step])
+
+    def step_name(self, func, instance):
+        name = func.__name__.replace('install_', '')
+        if len(self.instances) > 1:
+            name = '{0} ({1})'.format(name, instance['program'])
+        return name
+
+    def detect_java(self):
+        with self.java_lock:
+            if not hasattr(self, 'java_version'):
+                self.java_version = java_version(self.options['java-home'])
+                if self.java_version is None:
+                    self.logger.warning("Could not detect java version in %s, using only common JVM flags.",
+                                        self.options['java-home'])
+        return self.java_version
+
+    @property
+    def digests_file(self):
+        return os.path.join(self.options['cache-directory'], self.name + '-digests.json')
+
+    def load_digests(self):
+        """Loads the digests of the config files written by the last install."""
+        try:
+            with open(self.digests_file) as fp:
+                self.digests = json.load(fp)
+        except (IOError, OSError, ValueError):
+            self.digests = {}
+        self.changed = []
+        self.options_digest = hashlib.sha256(
+            repr(sorted((key, self.options[key]) for key in self.options)).encode('utf-8')).hexdigest()
+
+    def save_digests(self):
+        if not os.path.isdir(os.path.dirname(self.digests_file)):
+            os.makedirs(os.path.dirname(self.digests_file))
+        with open(self.digests_file, 'w') as fp:
+            json.dump(self.digests, fp, indent=2, sort_keys=True)
+
+    def input_digest(self, *sources):
+        """Digest of the recipe options and the modification time and size of the source files."""
+        stats = []
+        for source in sources:
+            try:
+                stat = os.stat(source)
+                stats.append((source, stat.st_mtime, stat.st_size))
+            except OSError:
+                stats.append((source, None, None))
+        return hashlib.sha256((self.options_digest + repr(stats)).encode('utf-8')).hexdigest()
+
+    def unchanged(self, path, *sources):
+        """Checks if path was written from the same inputs at the last install and was not modified since."""
+        stored = self.digests.get(path)
+        return stored is not None and stored[0] == self.input_digest(*sources) and file_digest(path) == stored[1]
+
+    def record(self, path, *sources):
+        """Records the digests of a file read by tomcat, a changed file needs a restart."""
+        stored = self.digests.get(path)
+        if stored is None or stored[1] != file_digest(path):
+            self.changed.append(path)
+        return self.record_unread(path, *sources)
+
+    def record_unread(self, path, *sources):
+        """Records the digests of a file not read by tomcat, i.e. the balancer configs and the restart script."""
+        self.digests[path] = [self.input_digest(*sources), file_digest(path)]
+        return [path]
+
+    def install_catalina_sh(self, instance):
+        path = os.path.join(instance['catalina_base'], 'bin', 'catalina.sh')
+        source = os.path.join(self.options['catalina-home'], 'bin', 'catalina.sh')
+        if self.unchanged(path, source):
+            return [path]
         config = Configuration(self.buildout, 'catalina.sh', {
             'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'bin'),
-            'mode': '0o755',
-            'file': os.path.join(self.options['catalina-home'], 'bin', 'catalina.sh')})
-        installed = [config.install()]
+            'directory': os.path.join(instance['catalina_base'], 'bin'),
+            'file': source})
+        config.install()
         # fix permission
-        os.chmod(os.path.join(self.options['catalina-base'], 'bin', 'catalina.sh'), 0o755)
-        return installed
+        os.chmod(path, 0o755)
+        return self.record(path, source)
 
-    def install_setenv_sh(self):
-        text = setenv_sh.render(**self.options)
+    def install_setenv_sh(self, instance):
+        path = os.path.join(instance['catalina_base'], 'bin', 'setenv.sh')
+        sources = [self.template_path('setenv.sh'),
+                   os.path.join(self.options['java-home'], 'release'),
+                   os.path.join(self.options['java-home'], 'bin', 'java')]
+        if self.unchanged(path, *sources):
+            return [path]
+        opts = java_opts(self.options, self.detect_java())
+        text = self.render('setenv.sh', java_opts=' '.join(opts), **instance)
         config = Configuration(self.buildout, 'setenv.sh', {
             'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'bin'),
+            'directory': os.path.join(instance['catalina_base'], 'bin'),
             'text': text})
-        return [config.install()]
+        config.install()
+        return self.record(path, *sources)
 
-    def install_web_xml(self):
+    def install_web_xml(self, instance):
+        path = os.path.join(instance['catalina_base'], 'conf', 'web.xml')
+        source = os.path.join(self.options['catalina-home'], 'conf', 'web.xml')
+        if self.unchanged(path, source):
+            return [path]
         config = Configuration(self.buildout, 'web.xml', {
             'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'conf'),
-            'file': os.path.join(self.options['catalina-home'], 'conf', 'web.xml')})
-        return [config.install()]
+            'directory': os.path.join(instance['catalina_base'], 'conf'),
+            'file': source})
+        config.install()
+        return self.record(path, source)
 
-    def install_tomcat_users_xml(self):
-        text = tomcat_users_xml.render(**self.options)
-        config = Configuration(self.buildout, 'tomcat-users.xml', {
+    def install_conf(self, instance, filename):
+        """Renders the template filename to the conf folder unless its inputs are unchanged."""
+        path = os.path.join(instance['catalina_base'], 'conf', filename)
+        source = self.template_path(filename)
+        if self.unchanged(path, source):
+            return [path]
+        text = self.render(filename, jdbc_resources=self.resources, **instance)
+        config = Configuration(self.buildout, filename, {
             'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'conf'),
+            'directory': os.path.join(instance['catalina_base'], 'conf'),
             'text': text})
-        return [config.install()]
+        config.install()
+        return self.record(path, source)
 
-    def install_server_xml(self):
-        text = server_xml.render(**self.options)
-        config = Configuration(self.buildout, 'server.xml', {
-            'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'conf'),
-            'text': text})
-        return [config.install()]
+    def install_tomcat_users_xml(self, instance):
+        return self.install_conf(instance, 'tomcat-users.xml')
+
+    def install_context_xml(self, instance):
+        return self.install_conf(instance, 'context.xml')
+
+    def install_server_xml(self, instance):
+        return self.install_conf(instance, 'server.xml')
+
+    def install_logging_props(self, instance):
+        return self.install_conf(instance, 'logging.properties')
+
+    def install_password_file(self, instance, filename):
+        """Renders the template filename to the conf folder readable by the tomcat user alone, the JVM rejects
+        a JMX password file readable by others. The file is created with this mode before the password is written."""
+        path = os.path.join(instance['catalina_base'], 'conf', filename)
+        source = self.template_path(filename)
+        if self.unchanged(path, source):
+            return [path]
+        text = self.render(filename, jdbc_resources=self.resources, **instance)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            # an existing file keeps its mode on open
+            os.fchmod(fd, 0o600)
+            os.fchown(fd, *self.user_ids)
+            fp.write(text)
+        return self.record(path, source)
+
+    def install_monitoring(self, instance):
+        """Installs the JMX password and access files and the rules of the prometheus JMX exporter."""
+        installed = []
+        if self.options['jmx'] == 'true':
+            installed += self.install_password_file(instance, 'jmxremote.password')
+            installed += self.install_conf(instance, 'jmxremote.access')
+        if self.options['prometheus-agent']:
+            if not os.path.isfile(self.options['prometheus-agent']):
+                raise zc.buildout.UserError(
+                    "Prometheus JMX exporter {0} not found.".format(self.options['prometheus-agent']))
+            installed += self.install_conf(instance, 'prometheus.yaml')
+        return installed
 
-    def install_logging_props(self):
-        text = logging_props.render(**self.options)
-        config = Configuration(self.buildout, 'logging.properties', {
+    def check_tls(self):
+        """Checks the certificate files and that tcnative is installed in the conda environment."""
+        for key in ('ssl-certificate', 'ssl-certificate-key', 'ssl-certificate-chain'):
+            if self.options[key] and not os.path.isfile(self.options[key]):
+                raise zc.buildout.UserError("File {0} of option {1} not found.".format(self.options[key], key))
+        tcnative = find_tcnative([os.path.join(self.options['conda-prefix'], 'lib'),
+                                  os.path.join(self.options['catalina-home'], 'lib')])
+        if tcnative is None:
+            raise zc.buildout.UserError(
+                "The tcnative library is required by the https connector but was not found in {0}, "
+                "add the tomcat-native package to pkgs.".format(self.options['conda-prefix']))
+        self.logger.info("Using tcnative library %s", tcnative)
+
+    def check_jdbc_drivers(self):
+        """Checks that the JDBC driver of each resource is in a jar of the common class loader."""
+        directories = [os.path.join(self.options['catalina-home'], 'lib')]
+        directories += [os.path.join(instance['catalina_base'], 'lib') for instance in self.instances]
+        classes = set()
+        for directory in directories:
+            for jar in glob.glob(os.path.join(directory, '*.jar')):
+                try:
+                    with zipfile.ZipFile(jar) as zf:
+                        classes.update(name for name in zf.namelist() if name.endswith('.class'))
+                except (IOError, OSError, zipfile.BadZipfile):
+                    self.logger.warning("Could not read jar %s", jar)
+        for resource in self.resources:
+            if resource['driver'].replace('.', '/') + '.class' not in classes:
+                raise zc.buildout.UserError(
+                    "JDBC driver {0} of resource {1} not found in the jars of {2}.".format(
+                        resource['driver'], resource['name'], ' or '.join(directories)))
+
+    def install_webapps(self):
+        """Extracts the webapps shared by all instances and installs their context in each instance."""
+        installed = []
+        for webapp in self.webapps:
+            if not os.path.isfile(webapp['warfile']):
+                raise zc.buildout.UserError("WAR file {0} of webapp {1} not found.".format(
+                    webapp['warfile'], webapp['name']))
+            written, removed = extract_war(webapp['warfile'], webapp['doc_base'])
+            for instance in self.instances:
+                installed += self.install_webapp_context(instance, webapp)
+            if self.options['precompile-jsp'] == 'true':
+                self.precompile_jsp(webapp, changed=bool(written or removed))
+        return installed
+
+    def install_webapp_context(self, instance, webapp):
+        directory = os.path.join(instance['catalina_base'], 'conf', 'Catalina', 'localhost')
+        path = os.path.join(directory, webapp['name'] + '.xml')
+        source = self.template_path('webapp.xml')
+        if self.unchanged(path, source):
+            return [path]
+        text = self.render('webapp.xml', webapp=webapp, **instance)
+        config = Configuration(self.buildout, webapp['name'] + '.xml', {
             'deployment': self.deployment_name,
-            'directory': os.path.join(self.options['catalina-base'], 'conf'),
+            'directory': directory,
             'text': text})
-        return [config.install()]
+        config.install()
+        return self.record(path, source)
+
+    def precompile_jsp(self, webapp, changed=True):
+        """Compiles the JSPs of the webapp once into the work folder of the first instance
+        and copies the compiled classes into the work folders of the other instances."""
+        scratches = [os.path.join(instance['catalina_base'], 'work', 'Catalina', 'localhost', webapp['name'])
+                     for instance in self.instances]
+        compiled = scratches[0]
+        updated = []
+        if changed or not os.path.isdir(compiled):
+            catalina_home = self.options['catalina-home']
+            classpath = os.pathsep.join([os.path.join(catalina_home, 'lib', '*'),
+                                         os.path.join(catalina_home, 'bin', 'tomcat-juli.jar')])
+            cmd = [os.path.join(self.options['java-home'], 'bin', 'java'), '-cp', classpath,
+                   'org.apache.jasper.JspC', '-webapp', webapp['doc_base'], '-d', compiled,
+                   '-compile', '-javaEncoding', 'UTF-8']
+            try:
+                check_output(cmd, stderr=STDOUT)
+            except (OSError, CalledProcessError) as err:
+                raise zc.buildout.UserError("Could not precompile the JSPs of {0}: {1}\n{2}".format(
+                    webapp['name'], err, getattr(err, 'output', b'').decode('utf-8', 'replace')))
+            updated.append(compiled)
+        for scratch in scratches[1:]:
+            if updated or not os.path.isdir(scratch):
+                if os.path.isdir(scratch):
+                    shutil.rmtree(scratch)
+                shutil.copytree(compiled, scratch)
+                updated.append(scratch)
+        uid, gid = self.user_ids
+        for scratch in updated:
+            for dirpath, dirnames, filenames in os.walk(scratch):
+                os.chown(dirpath, uid, gid)
+                for filename in filenames:
+                    os.chown(os.path.join(dirpath, filename), uid, gid)
+
+    def balancer_nodes(self):
+        """Returns the nodes of the cluster: the instances of this part and the additional cluster-nodes."""
+        nodes = [{'jvm_route': instance['jvm_route'],
+                  'host': self.options['cluster-host'],
+                  'http_port': instance['http_port'],
+                  'ajp_port': instance['ajp_port']} for instance in self.instances]
+        return nodes + self.cluster_nodes
+
+    def install_balancer(self):
+        """Installs the mod_jk workers.properties and nginx upstream config for the cluster in etc-directory."""
+        installed = []
+        for filename in ('workers.properties', 'nginx-upstream.conf'):
+            path = os.path.join(self.options['etc-directory'], filename)
+            source = self.template_path(filename)
+            if self.unchanged(path, source):
+                installed.append(path)
+                continue
+            text = self.render(filename, nodes=self.balancer_nodes())
+            config = Configuration(self.buildout, filename, {
+                'deployment': self.deployment_name,
+                'text': text})
+            config.install()
+            installed += self.record_unread(path, source)
+        return installed
+
+    def install_restart_script(self):
+        """Installs the script restarting the instances one after another in the buildout bin-directory."""
+        directory = self.buildout['buildout']['bin-directory']
+        path = os.path.join(directory, self.name + '-restart')
+        source = self.template_path('restart.sh')
+        if self.unchanged(path, source):
+            return [path]
+        text = self.render('restart.sh', instances=self.instances,
+                           supervisorctl=os.path.join(directory, 'supervisorctl'))
+        # bin-directory belongs to buildout, a deployment Configuration would chown it to etc-user
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as fp:
+            fp.write(text)
+        os.chmod(path, 0o755)
+        return self.record_unread(path, source)
 
-    def install_supervisor(self, update=False):
+    def install_supervisor(self, instance, update=False):
         script = supervisor.Recipe(
             self.buildout,
-            self.name,
+            instance['part'],
             {'prefix': self.options['prefix'],
              'user': self.options.get('user'),
              'etc-user': self.options['etc-user'],
-             'program': 'tomcat',
-             'command': '{0} run'.format(os.path.join(self.options['catalina-base'], 'bin', 'catalina.sh')),
+             'program': instance['program'],
+             'command': '{0} run'.format(os.path.join(instance['catalina_base'], 'bin', 'catalina.sh')),
+             # catalina.sh run execs java, its shutdown hook stops tomcat gracefully on TERM
+             'stopsignal': 'TERM',
+             'stopwaitsecs': self.options['stop-timeout'],
              })
         return script.install(update)
 
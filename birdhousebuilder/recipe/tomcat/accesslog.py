@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""Latency report of tomcat access logs.
+
+Reads access logs written with the ``text`` or ``json`` pattern of the recipe and reports
+the request count and latency percentiles per webapp path::
+
+    $ tomcat-accesslog var/log/tomcat/localhost_access_log.*.txt
+"""
+
+import io
+import re
+import sys
+import math
+import gzip
+import json
+import argparse
+from collections import defaultdict
+
+# default text pattern: %h %l %u %t "%r" %s %b %D %F %I
+TEXT_LINE = re.compile(
+    r'^\S+ \S+ \S+ \[[^\]]*\] "(?:\S+ )?(?P<path>[^ "?]*)[^"]*" (?P<status>\d{3}) \S+ (?P<duration>\d+)')
+
+
+def parse_line(line):
+    """Returns the request path and duration of a log line or None if the line has no duration."""
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            return record['path'], int(record['duration'])
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = TEXT_LINE.match(line)
+    if match:
+        return match.group('path'), int(match.group('duration'))
+    return None
+
+
+def webapp_path(path, depth=1):
+    """Returns the first depth segments of path, i.e. /thredds/wms/x.nc -> /thredds with depth 1."""
+    segments = [segment for segment in path.split('/') if segment][:depth]
+    return '/' + '/'.join(segments)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of the sorted list values."""
+    if not values:
+        return 0
+    rank = max(int(math.ceil(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def analyze(lines, depth=1, percentiles=(50, 90, 99)):
+    """Streams log lines and returns the statistics per webapp path sorted by total duration."""
+    durations = defaultdict(list)
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        path, duration = parsed
+        durations[webapp_path(path, depth)].append(duration)
+    stats = []
+    for path, values in durations.items():
+        values.sort()
+        stat = {'path': path, 'count': len(values), 'total': sum(values), 'max': values[-1]}
+        for pct in percentiles:
+            stat['p{0}'.format(pct)] = percentile(values, pct)
+        stats.append(stat)
+    stats.sort(key=lambda stat: stat['total'], reverse=True)
+    return stats
+
+
+def read_lines(filenames):
+    for filename in filenames:
+        if filename == '-':
+            for line in sys.stdin:
+                yield line
+            continue
+        if filename.endswith('.gz'):
+            # gzip.open of python 2.7 has no text mode
+            fp = io.TextIOWrapper(gzip.open(filename))
+        else:
+            fp = open(filename)
+        with fp:
+            for line in fp:
+                yield line
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Report latency percentiles per webapp of tomcat access logs.")
+    parser.add_argument('logfiles', nargs='+', help="access log files, gzipped files or - for stdin")
+    parser.add_argument('--depth', type=int, default=1, help="number of path segments to group by (default: 1)")
+    parser.add_argument('--percentiles', default='50,90,99', help="comma separated percentiles (default: 50,90,99)")
+    parser.add_argument('--json', action='store_true', help="print the report as json")
+    options = parser.parse_args(args)
+
+    percentiles = [int(pct) for pct in options.percentiles.split(',')]
+    stats = analyze(read_lines(options.logfiles), options.depth, percentiles)
+    if options.json:
+        json.dump(stats, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    columns = ['count'] + ['p{0}'.format(pct) for pct in percentiles] + ['max']
+    sys.stdout.write('{0:<40}'.format('path') + ''.join('{0:>10}'.format(column) for column in columns) + '\n')
+    for stat in stats:
+        sys.stdout.write('{0:<40}'.format(stat['path']) +
+                         ''.join('{0:>10}'.format(stat[column]) for column in columns) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/bin/bash
+# Restarts the tomcat instances of ${name} one after another. Each instance is stopped gracefully by
+# supervisor and must answer its health check URL before the next instance is restarted.
+#
+SUPERVISORCTL="${supervisorctl}"
+TIMEOUT=${health_check_timeout}
+
+ready() {
+    if command -v curl > /dev/null; then
+        curl --silent --fail --max-time 5 --output /dev/null "$1"
+    else
+        wget --quiet --timeout=5 --output-document=/dev/null "$1"
+    fi
+}
+
+wait_ready() {
+    for i in $(seq $TIMEOUT); do
+        ready "$2" && return 0
+        sleep 1
+    done
+    echo "$1 not ready at $2 after $TIMEOUT seconds, stopping the restart." >&2
+    return 1
+}
+
+PROGRAMS="${' '.join(instance['program'] for instance in instances)}"
+if [ $# -gt 0 ]; then
+    PROGRAMS="$*"
+fi
+
+for program in $PROGRAMS; do
+    case $program in
+% for instance in instances:
+    ${instance['program']}) url="${instance['health_check_url']}" ;;
+% endfor
+    *) echo "Unknown program $program, use one of ${' '.join(instance['program'] for instance in instances)}" >&2; exit 1 ;;
+    esac
+    echo "Restarting $program"
+    $SUPERVISORCTL restart $program || exit 1
+    wait_ready $program "$url" || exit 1
+done
@@ -2,7 +2,17 @@
 # see thredds example for tomcat:
 # http://www.unidata.ucar.edu/software/thredds/current/tds/UpgradingTo4.5.html
 #
+% if auto_size == 'true':
+# auto-size:
+%   for note in auto_size_notes.splitlines():
+#   ${note}
+%   endfor
+% endif
+% if ulimit_nofile:
+ulimit -n ${ulimit_nofile}
+% else:
 #ulimit -n 2048
+% endif
 #
 CATALINA_HOME="${catalina_home}"
 export CATALINA_HOME
@@ -10,14 +20,41 @@ CATALINA_BASE="${catalina_base}"
 export CATALINA_BASE
 #
 #CONTENT_ROOT="-Dtds.content.root.path="
-NORMAL="-d64 -Xmx${Xmx} -Xms${Xms} -server"
-MAX_PERM_GEN="-XX:MaxPermSize=${MaxPermSize}"
+# JVM flags of the jvm-profile supported by the installed java
+NORMAL="${java_opts}"
 HEADLESS="-Djava.awt.headless=true"
 # set prefs folder used by java
 JAVA_PREFS="-Djava.util.prefs.systemRoot=${catalina_base}/java_prefs/.java -Djava.util.prefs.userRoot=${catalina_base}/java_prefs/.java/.userPrefs"
 #             
 JAVA_HOME="${java_home}"
 export JAVA_HOME
+% if https == 'true':
+# tcnative of the conda environment used by the https connector
+LD_LIBRARY_PATH="${conda_prefix}/lib:${catalina_home}/lib:$LD_LIBRARY_PATH"
+export LD_LIBRARY_PATH
+% endif
 JAVA_OPTS="$HEADLESS $NORMAL $JAVA_PREFS"
+% if entropy_source:
+# entropy source of SecureRandom, /dev/random blocks the session id generation
+JAVA_OPTS="$JAVA_OPTS -Djava.security.egd=${entropy_source}"
+% endif
+% if async_logging == 'true':
+# queue of the asynchronous log handlers
+ASYNC_LOGGING="-Dorg.apache.juli.AsyncMaxRecordCount=${log_queue_size} -Dorg.apache.juli.AsyncOverflowDropType=${log_overflow_type}"
+JAVA_OPTS="$JAVA_OPTS $ASYNC_LOGGING"
+% endif
 export JAVA_OPTS
+# options only used to start tomcat, not to stop it
+CATALINA_OPTS=""
+% if jmx == 'true':
+# remote JMX bound to localhost
+JMX="-Dcom.sun.management.jmxremote -Dcom.sun.management.jmxremote.port=${jmx_port} -Dcom.sun.management.jmxremote.rmi.port=${jmx_port} -Dcom.sun.management.jmxremote.host=127.0.0.1 -Djava.rmi.server.hostname=127.0.0.1 -Dcom.sun.management.jmxremote.ssl=false -Dcom.sun.management.jmxremote.authenticate=true -Dcom.sun.management.jmxremote.password.file=${catalina_base}/conf/jmxremote.password -Dcom.sun.management.jmxremote.access.file=${catalina_base}/conf/jmxremote.access"
+CATALINA_OPTS="$CATALINA_OPTS $JMX"
+% endif
+% if prometheus_agent:
+# prometheus JMX exporter
+METRICS="-javaagent:${prometheus_agent}=${prometheus_host}:${prometheus_port}:${catalina_base}/conf/prometheus.yaml"
+CATALINA_OPTS="$CATALINA_OPTS $METRICS"
+% endif
+export CATALINA_OPTS
 
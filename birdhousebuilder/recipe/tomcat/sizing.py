@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""Sizing of heap, threads and file descriptors from the resources of the host.
+
+The CPU count and memory are limited by the cgroup of the buildout process, so that
+a buildout running in a container sizes tomcat for the container and not for the host.
+"""
+
+import os
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+# cgroup v1 reports a page aligned maximum when no memory limit is set
+UNLIMITED_MEMORY = 2 ** 60
+
+# share of the memory of an instance used by the heap, the rest is left to metaspace, thread stacks,
+# direct buffers and the page cache
+HEAP_SHARE = 0.6
+MIN_HEAP = 256
+THREADS_PER_CPU = 50
+MIN_THREADS = 50
+MAX_THREADS = 1000
+MAX_CONNECTIONS = 10000
+# file descriptors of an instance not used by connections: jars, logs, webapp resources
+RESERVED_FILES = 1024
+# options derived by auto_size
+AUTO_SIZE_OPTIONS = ('Xmx', 'Xms', 'max-threads', 'min-spare-threads', 'max-connections', 'ulimit-nofile')
+
+
+def read_first_line(path):
+    try:
+        with open(path) as fp:
+            return fp.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def cgroup_cpus():
+    """Returns the CPU quota of the cgroup or None if not limited."""
+    line = read_first_line('/sys/fs/cgroup/cpu.max')
+    if line:
+        quota, period = line.split()[:2]
+        if quota != 'max':
+            return float(quota) / float(period)
+        return None
+    quota = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return float(quota) / float(period)
+    return None
+
+
+def cpu_count():
+    """Returns the number of usable CPUs limited by the CPU affinity and the cgroup quota."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = multiprocessing.cpu_count()
+    quota = cgroup_cpus()
+    if quota is not None:
+        count = min(count, int(quota + 0.5))
+    return max(count, 1)
+
+
+def memory():
+    """Returns the usable memory in bytes and where the limit comes from."""
+    try:
+        total, source = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'), 'physical memory'
+    except (ValueError, OSError, AttributeError):
+        total, source = None, None
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        line = read_first_line(path)
+        if line and line.isdigit() and int(line) < UNLIMITED_MEMORY:
+            if total is None or int(line) < total:
+                total, source = int(line), 'cgroup memory limit'
+            break
+    return total, source
+
+
+def open_files():
+    """Returns the soft and hard limit of open files, None if unknown or unlimited."""
+    if resource is None:
+        return None, None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return (None if soft == resource.RLIM_INFINITY else soft,
+            None if hard == resource.RLIM_INFINITY else hard)
+
+
+def host_resources():
+    total, source = memory()
+    soft, hard = open_files()
+    return {'cpus': cpu_count(), 'memory': total, 'memory_source': source,
+            'open_files': soft, 'open_files_max': hard}
+
+
+def size_mb(value):
+    """Returns a JVM memory size like 512m or 2g in megabytes or None if it can not be parsed."""
+    value = value.strip().lower()
+    units = {'k': 1.0 / 1024, 'm': 1, 'g': 1024, 't': 1024 * 1024}
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value) // MB
+    except ValueError:
+        return None
+
+
+def auto_size(host, instances=1, given=None):
+    """Returns the recipe options derived from the host resources shared by the given number of instances
+    and the notes explaining each value. Options in given are kept and the derived values depend on them,
+    e.g. Xms is derived from a given Xmx and never exceeds it."""
+    given = given or {}
+    values = {}
+    notes = ['{0} instance(s) on {1} CPU(s), {2} MB {3}, open files limit {4} (hard {5})'.format(
+        instances, host['cpus'], host['memory'] // MB if host['memory'] else 'unknown',
+        host['memory_source'] or 'memory', host['open_files'] or 'unlimited', host['open_files_max'] or 'unlimited')]
+
+    def given_int(key, default):
+        try:
+            return int(given[key]) if key in given else default
+        except ValueError:
+            return default
+
+    def derive(key, value, note):
+        if key in given:
+            notes.append('{0} {1}: given in the buildout'.format(key, given[key]))
+        else:
+            values[key] = str(value)
+            notes.append('{0} {1}: {2}'.format(key, value, note))
+
+    heap = size_mb(given['Xmx']) if 'Xmx' in given else None
+    initial = size_mb(given['Xms']) if 'Xms' in given else None
+    if 'Xmx' in given:
+        notes.append('Xmx {0}: given in the buildout'.format(given['Xmx']))
+    elif host['memory']:
+        heap = max(int(host['memory'] * HEAP_SHARE / instances) // MB, MIN_HEAP)
+        if initial is not None and initial > heap:
+            heap = initial
+            derive('Xmx', '{0}m'.format(heap), 'raised to the given Xms')
+        else:
+            derive('Xmx', '{0}m'.format(heap), '{0:.0%} of the memory per instance'.format(HEAP_SHARE))
+    if heap is not None:
+        derive('Xms', '{0}m'.format(min(max(heap // 4, 128), heap)), 'a quarter of Xmx')
+
+    cpus = max(host['cpus'] // instances, 1)
+    threads = min(max(cpus * THREADS_PER_CPU, MIN_THREADS), MAX_THREADS)
+    derive('max-threads', threads, '{0} per CPU of the instance'.format(THREADS_PER_CPU))
+    threads = given_int('max-threads', threads)
+    derive('min-spare-threads', min(max(threads // 10, 10), threads), 'a tenth of max-threads')
+
+    # the ulimit can be raised up to the hard limit in setenv.sh, a given ulimit-nofile limits the connections
+    limit = given_int('ulimit-nofile', host['open_files_max'])
+    connections = MAX_CONNECTIONS
+    if limit:
+        connections = min(connections, max(limit - RESERVED_FILES, threads))
+    derive('max-connections', connections,
+           '{0} file descriptors reserved besides the connections'.format(RESERVED_FILES))
+    connections = given_int('max-connections', connections)
+    nofile = connections + RESERVED_FILES
+    if host['open_files_max']:
+        nofile = min(nofile, host['open_files_max'])
+    derive('ulimit-nofile', nofile, 'max-connections and the reserved file descriptors')
+    return values, notes
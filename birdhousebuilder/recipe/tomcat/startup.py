@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Startup time report of tomcat.
+
+Reads the catalina log (``catalina.out``, ``catalina.<date>.log`` or the supervisor log of tomcat)
+and reports the server startup time and the deployment time of each webapp::
+
+    $ tomcat-startup var/log/tomcat/catalina.*.log
+"""
+
+import re
+import sys
+import json
+import argparse
+
+SERVER_STARTUP = re.compile(r'Server startup in \[?([\d,.]+)\]? (?:ms|milliseconds)')
+DEPLOYMENT = re.compile(
+    r'Deployment of (?:web application directory|web application archive|configuration descriptor) '
+    r'\[?(.+?)\]? has finished in \[?([\d,.]+)\]? ms')
+# jars scanned for TLDs without containing any, candidates for jar-scan-skip
+NO_TLDS = re.compile(r'At least one JAR was scanned for TLDs yet contained no TLDs')
+
+
+def as_ms(value):
+    return int(value.replace(',', '').replace('.', ''))
+
+
+def webapp_name(path):
+    """Returns the webapp name of a deployed directory, WAR file or context descriptor."""
+    name = path.rstrip('/').split('/')[-1]
+    for extension in ('.war', '.xml'):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+
+def parse(lines):
+    """Returns a record for each server startup found in the log lines."""
+    startups = []
+    record = {'webapps': {}, 'no_tlds': 0}
+    for line in lines:
+        match = DEPLOYMENT.search(line)
+        if match:
+            record['webapps'][webapp_name(match.group(1))] = as_ms(match.group(2))
+            continue
+        if NO_TLDS.search(line):
+            record['no_tlds'] += 1
+            continue
+        match = SERVER_STARTUP.search(line)
+        if match:
+            record['startup'] = as_ms(match.group(1))
+            startups.append(record)
+            record = {'webapps': {}, 'no_tlds': 0}
+    return startups
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Report the startup time of tomcat and its webapps.")
+    parser.add_argument('logfiles', nargs='+', help="catalina log files or - for stdin")
+    parser.add_argument('--all', action='store_true', help="report all startups instead of the last one")
+    parser.add_argument('--json', action='store_true', help="print the report as json")
+    options = parser.parse_args(args)
+
+    startups = []
+    for filename in options.logfiles:
+        if filename == '-':
+            startups += parse(sys.stdin)
+        else:
+            with open(filename) as fp:
+                startups += parse(fp)
+    if not options.all:
+        startups = startups[-1:]
+    if options.json:
+        json.dump(startups, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+    if not startups:
+        sys.stdout.write("No server startup found.\n")
+    for record in startups:
+        sys.stdout.write("Server startup in {0} ms\n".format(record['startup']))
+        for name, ms in sorted(record['webapps'].items(), key=lambda item: -item[1]):
+            sys.stdout.write("  {0:<40}{1:>10} ms\n".format(name, ms))
+        if record['no_tlds']:
+            sys.stdout.write("  {0} webapps scanned JARs without TLDs, see the jar-scan-skip option.\n".format(
+                record['no_tlds']))
+
+
+if __name__ == '__main__':
+    main()
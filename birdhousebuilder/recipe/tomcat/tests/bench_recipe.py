@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for 'birdhousebuilder.recipe.tomcat'.
+
+Measures Recipe.__init__, template rendering, install() and a no-op update() against a temporary
+prefix with the conda and supervisor recipes stubbed out. The results are printed as json::
+
+    $ python -m birdhousebuilder.recipe.tomcat.tests.bench_recipe --repeat 20 --output bench.json
+"""
+
+import os
+import sys
+import pwd
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+
+import birdhousebuilder.recipe.conda
+from birdhousebuilder.recipe import tomcat
+from birdhousebuilder.recipe.tomcat.tests.stubs import Buildout, CondaStub, SupervisorStub, make_conda_prefix
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    timings.sort()
+    return {'repeat': repeat,
+            'min': timings[0],
+            'median': timings[len(timings) // 2],
+            'mean': sum(timings) / len(timings),
+            'max': timings[-1]}
+
+
+def run(repeat=10, options=None):
+    user = pwd.getpwuid(os.getuid())[0]
+    tmpdir = tempfile.mkdtemp()
+    CondaStub.prefix = os.path.join(tmpdir, 'conda')
+    make_conda_prefix(CondaStub.prefix)
+    conda_recipe, supervisor_recipe = birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe
+    birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe = CondaStub, SupervisorStub
+    try:
+        prefix = os.path.join(tmpdir, 'prefix')
+
+        def make_recipe():
+            recipe_options = {'prefix': prefix, 'user': user, 'etc-user': user}
+            recipe_options.update(options or {})
+            return tomcat.Recipe(Buildout(tmpdir), 'tomcat', recipe_options)
+
+        results = {'init': measure(make_recipe, repeat)}
+
+        recipe = make_recipe()
+        instance = recipe.instances[0]
+        for filename in ('setenv.sh', 'server.xml', 'context.xml', 'logging.properties'):
+            results['render ' + filename] = measure(
+                lambda: recipe.render(filename, java_opts='', jdbc_resources=recipe.resources, **instance), repeat)
+
+        def install():
+            shutil.rmtree(prefix)
+            make_recipe().install()
+        results['install'] = measure(install, repeat)
+
+        make_recipe().install()
+        results['update'] = measure(lambda: make_recipe().update(), repeat)
+
+        # time of each step of a fresh install and of a no-op update
+        shutil.rmtree(prefix)
+        recipe = make_recipe()
+        recipe.install()
+        results['install steps'] = recipe.timings
+        recipe = make_recipe()
+        recipe.update()
+        results['update steps'] = recipe.timings
+        return results
+    finally:
+        birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe = conda_recipe, supervisor_recipe
+        shutil.rmtree(tmpdir)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tomcat recipe.")
+    parser.add_argument('--repeat', type=int, default=10, help="number of runs of each benchmark (default: 10)")
+    parser.add_argument('--instances', default='1', help="number of tomcat instances (default: 1)")
+    parser.add_argument('--output', help="write the json results to this file instead of stdout")
+    options = parser.parse_args(args)
+
+    # the recipe logs each created folder and installed file
+    logging.disable(logging.INFO)
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'instances': options.instances,
+              'benchmarks': run(options.repeat, {'instances': options.instances})}
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Stubs of buildout and of the conda and supervisor recipes used by the tests and benchmarks.
+"""
+
+import os
+
+
+class Buildout(dict):
+    """Minimal buildout with the sections used by the recipe and zc.recipe.deployment."""
+
+    def __init__(self, directory):
+        dict.__init__(self)
+        self._raw = {}
+        self['buildout'] = {'directory': directory,
+                            'parts-directory': os.path.join(directory, 'parts'),
+                            'bin-directory': os.path.join(directory, 'bin')}
+
+    def __getitem__(self, key):
+        if key in self._raw:
+            return self._raw[key]
+        return dict.__getitem__(self, key)
+
+
+class CondaStub(object):
+    prefix = None
+
+    def __init__(self, buildout, name, options):
+        self.options = dict(options, prefix=CondaStub.prefix)
+
+    def install(self, update=False):
+        return []
+
+
+class SupervisorStub(object):
+
+    def __init__(self, buildout, name, options):
+        self.options = options
+
+    def install(self, update=False):
+        return []
+
+
+def make_conda_prefix(prefix):
+    """Creates the files of the apache-tomcat conda package used by the recipe."""
+    catalina_home = os.path.join(prefix, 'opt', 'apache-tomcat')
+    for name, text in (('bin/catalina.sh', '#!/bin/sh\n'), ('conf/web.xml', '<web-app/>\n')):
+        path = os.path.join(catalina_home, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(text)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the access log report of 'birdhousebuilder.recipe.tomcat'.
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from birdhousebuilder.recipe.tomcat import accesslog
+
+TEXT_LINES = [
+    '127.0.0.1 - - [17/Oct/2016:10:00:00 +0200] "GET /thredds/catalog.xml HTTP/1.1" 200 5120 40 2 http-nio-8080-exec-1',
+    '127.0.0.1 - - [17/Oct/2016:10:00:01 +0200] "GET /ncWMS2/wms?REQUEST=GetMap HTTP/1.1" 200 - 250 3 http-nio-8080-exec-2',
+    '127.0.0.1 - - [17/Oct/2016:10:00:02 +0200] "GET /ncWMS2/wms?REQUEST=GetMap HTTP/1.1" 200 - 750 3 http-nio-8080-exec-3',
+    '127.0.0.1 - - [17/Oct/2016:10:00:03 +0200] "GET / HTTP/1.1" 200 11 1',
+]
+
+JSON_LINE = ('{"time":"2016-10-17T10:00:00.000+0200","remote":"127.0.0.1","method":"GET",'
+             '"path":"/thredds/wms/x.nc","query":"","status":200,"bytes":10,"duration":30,"commit":1,"thread":"t"}')
+
+
+class AccessLogTestCase(unittest.TestCase):
+
+    def test_parse_text_line(self):
+        self.assertEqual(accesslog.parse_line(TEXT_LINES[1]), ('/ncWMS2/wms', 250))
+
+    def test_parse_json_line(self):
+        self.assertEqual(accesslog.parse_line(JSON_LINE), ('/thredds/wms/x.nc', 30))
+
+    def test_parse_common_line(self):
+        # the common pattern has no request duration
+        self.assertEqual(accesslog.parse_line('127.0.0.1 - - [17/Oct/2016:10:00:00 +0200] "GET / HTTP/1.1" 200 11'),
+                         None)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(accesslog.percentile(values, 50), 50)
+        self.assertEqual(accesslog.percentile(values, 99), 99)
+        self.assertEqual(accesslog.percentile([7], 90), 7)
+
+    def test_analyze(self):
+        stats = accesslog.analyze(TEXT_LINES + [JSON_LINE])
+        self.assertEqual([stat['path'] for stat in stats], ['/ncWMS2', '/thredds', '/'])
+        self.assertEqual(stats[0]['count'], 2)
+        self.assertEqual(stats[0]['p50'], 250)
+        self.assertEqual(stats[0]['max'], 750)
+        self.assertEqual(stats[1]['p99'], 40)
+
+    def test_read_lines(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            plain = os.path.join(tmpdir, 'localhost_access_log.2016-10-17.txt')
+            with open(plain, 'w') as fp:
+                fp.write('\n'.join(TEXT_LINES[:2]) + '\n')
+            rotated = os.path.join(tmpdir, 'localhost_access_log.2016-10-16.txt.gz')
+            with gzip.open(rotated, 'wb') as fp:
+                fp.write(('\n'.join(TEXT_LINES[2:]) + '\n').encode('utf-8'))
+            lines = list(accesslog.read_lines([rotated, plain]))
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual([line.rstrip('\n') for line in lines], TEXT_LINES[2:] + TEXT_LINES[:2])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the JVM flags of 'birdhousebuilder.recipe.tomcat' depending on the java version.
+"""
+
+import unittest
+
+from birdhousebuilder.recipe.tomcat import parse_java_version, supports, java_opts
+
+OPTIONS = {'Xmx': '1024m', 'Xms': '128m', 'MaxPermSize': '128m', 'MaxMetaspaceSize': '', 'MaxRAMPercentage': '75.0'}
+
+
+def opts(version, profile=''):
+    return java_opts(dict(OPTIONS, **{'jvm-profile': profile}), version)
+
+
+class JavaVersionTestCase(unittest.TestCase):
+
+    def test_parse_java_version(self):
+        for text, expected in (('1.7.0_80', (7, 80)),
+                               ('1.8.0_191', (8, 191)),
+                               ('1.8.0', (8, 0)),
+                               ('9', (9, 0)),
+                               ('11.0.2', (11, 2)),
+                               ('17.0.8.1', (17, 8)),
+                               ('21-ea', (21, 0)),
+                               ('', None),
+                               (None, None),
+                               ('unknown', None)):
+            self.assertEqual(parse_java_version(text), expected, text)
+
+    def test_supports(self):
+        for version, since, until, expected in (((7, 80), (0, 0), (8, 0), True),
+                                                ((8, 0), (0, 0), (8, 0), False),
+                                                ((8, 191), (8, 191), (9, 0), True),
+                                                ((8, 181), (8, 191), (9, 0), False),
+                                                ((9, 0), (8, 191), (9, 0), False),
+                                                ((17, 0), (15, 0), None, True),
+                                                (None, (8, 0), None, True),
+                                                (None, (8, 20), None, False),
+                                                (None, (0, 0), (10, 0), False)):
+            self.assertEqual(supports(version, since, until), expected, (version, since, until))
+
+
+class JavaOptsTestCase(unittest.TestCase):
+
+    def test_flags(self):
+        # (version, profile, expected flags, unexpected flags)
+        for version, profile, present, absent in (
+                ((7, 80), '', ['-d64', '-Xmx1024m', '-XX:MaxPermSize=128m'], ['-XX:MaxMetaspaceSize=512m']),
+                ((8, 181), 'container', ['-Xmx1024m', '-XX:+UseG1GC', '-XX:+ExitOnOutOfMemoryError'],
+                 ['-XX:MaxRAMPercentage=75.0']),
+                ((8, 191), 'container', ['-XX:MaxRAMPercentage=75.0', '-XX:MaxMetaspaceSize=512m'],
+                 ['-Xmx1024m', '-XX:MaxPermSize=128m']),
+                ((8, 191), '', ['-d64', '-Xmx1024m'], ['-XX:MaxMetaspaceSize=512m']),
+                ((9, 0), 'container', ['-Xmx1024m'], ['-XX:MaxRAMPercentage=75.0']),
+                ((11, 2), 'throughput', ['-XX:+UseParallelGC', '-XX:+AlwaysPreTouch'],
+                 ['-d64', '-XX:+UseStringDeduplication']),
+                ((11, 2), 'low-latency', ['-XX:+UseG1GC', '-XX:MaxGCPauseMillis=200', '-XX:+UseStringDeduplication'],
+                 ['-XX:+UseZGC']),
+                ((17, 0), 'low-latency', ['-XX:+UseZGC', '-XX:+AlwaysPreTouch'],
+                 ['-XX:+UseG1GC', '-XX:+UseStringDeduplication']),
+                ((21, 0), 'low-latency', ['-XX:+UseZGC', '-XX:+UseStringDeduplication'], []),
+                ((21, 0), 'throughput', ['-XX:+UseParallelGC', '-XX:+UseStringDeduplication'], []),
+                (None, '', ['-Xmx1024m', '-Xms128m', '-server'], ['-d64', '-XX:MaxPermSize=128m']),
+                (None, 'low-latency', ['-XX:+UseG1GC'], ['-XX:+UseZGC', '-XX:+UseStringDeduplication'])):
+            flags = opts(version, profile)
+            for flag in present:
+                self.assertIn(flag, flags, (version, profile))
+            for flag in absent:
+                self.assertNotIn(flag, flags, (version, profile))
+
+    def test_given_metaspace(self):
+        self.assertIn('-XX:MaxMetaspaceSize=256m',
+                      java_opts(dict(OPTIONS, **{'jvm-profile': '', 'MaxMetaspaceSize': '256m'}), (11, 0)))
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the options of 'birdhousebuilder.recipe.tomcat' with the conda and supervisor recipes stubbed out.
+"""
+
+import os
+import pwd
+import logging
+import shutil
+import tempfile
+import unittest
+import zipfile
+from xml.etree import ElementTree
+
+import zc.buildout
+
+import birdhousebuilder.recipe.conda
+from birdhousebuilder.recipe import tomcat
+from birdhousebuilder.recipe.tomcat.tests.stubs import Buildout, CondaStub, SupervisorStub, make_conda_prefix
+
+
+class RecipeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, 'prefix')
+        CondaStub.prefix = os.path.join(self.tmpdir, 'conda')
+        make_conda_prefix(CondaStub.prefix)
+        self.recipes = birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe
+        birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe = CondaStub, SupervisorStub
+
+    def tearDown(self):
+        birdhousebuilder.recipe.conda.Recipe, tomcat.supervisor.Recipe = self.recipes
+        shutil.rmtree(self.tmpdir)
+
+    def make_recipe(self, **options):
+        user = pwd.getpwuid(os.getuid())[0]
+        recipe_options = {'prefix': self.prefix, 'user': user, 'etc-user': user}
+        recipe_options.update(options)
+        return tomcat.Recipe(Buildout(self.tmpdir), 'tomcat', recipe_options)
+
+
+class InstancesTestCase(RecipeTestCase):
+
+    def test_single_instance(self):
+        instance, = self.make_recipe().instances
+        self.assertEqual(instance['program'], 'tomcat')
+        self.assertEqual((instance['http_port'], instance['https_port'], instance['shutdown_port'],
+                          instance['ajp_port']), ('8080', '8443', '8005', '8009'))
+        self.assertEqual(instance['jmx_port'], '9010')
+
+    def test_shifted_ports(self):
+        instances = self.make_recipe(instances='3', **{'port-offset': '100'}).instances
+        self.assertEqual([instance['program'] for instance in instances], ['tomcat-1', 'tomcat-2', 'tomcat-3'])
+        self.assertEqual([instance['http_port'] for instance in instances], ['8080', '8180', '8280'])
+        self.assertEqual([instance['prometheus_port'] for instance in instances], ['9404', '9504', '9604'])
+        self.assertEqual([instance['cluster_receiver_port'] for instance in instances], ['4000', '4100', '4200'])
+
+    def test_same_base_ports(self):
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, ajp_port='8080')
+
+    def test_shifted_port_collision(self):
+        # instance 2 http_port 8081 is the https_port of instance 1
+        self.assertRaises(zc.buildout.UserError, self.make_recipe,
+                          instances='3', https_port='8081', **{'port-offset': '1'})
+
+    def test_monitoring_port_collision(self):
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, instances='2',
+                          **{'jmx': 'true', 'jmx-password': 'secret', 'jmx-port': '8090'})
+
+    def test_disabled_ports_do_not_collide(self):
+        # the default jmx-port 9010 is the http_port of the second instance
+        recipe = self.make_recipe(http_port='9000', instances='2')
+        self.assertEqual([instance['http_port'] for instance in recipe.instances], ['9000', '9010'])
+        self.make_recipe(instances='2', **{'jmx-port': '8090', 'prometheus-port': '8090',
+                                           'cluster-receiver-port': '8090'})
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, http_port='9000', instances='2',
+                          **{'jmx': 'true', 'jmx-password': 'secret'})
+
+
+class DigestsTestCase(RecipeTestCase):
+
+    def setUp(self):
+        RecipeTestCase.setUp(self)
+        logging.disable(logging.INFO)
+        self.make_recipe().install()
+        self.server_xml = os.path.join(self.prefix, 'var', 'lib', 'tomcat', 'conf', 'server.xml')
+        # an old modification time shows if the file is written again
+        os.utime(self.server_xml, (0, 0))
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        RecipeTestCase.tearDown(self)
+
+    def update(self, **options):
+        # each buildout run starts with new template lookups
+        tomcat._lookups.clear()
+        recipe = self.make_recipe(**options)
+        recipe.update()
+        return recipe
+
+    def test_noop_update(self):
+        recipe = self.update()
+        self.assertEqual(recipe.changed, [])
+        self.assertFalse(recipe.restart_needed)
+        self.assertEqual(os.path.getmtime(self.server_xml), 0)
+
+    def test_edited_file_restored(self):
+        with open(self.server_xml) as fp:
+            text = fp.read()
+        with open(self.server_xml, 'w') as fp:
+            fp.write('<Server/>')
+        recipe = self.update()
+        with open(self.server_xml) as fp:
+            self.assertEqual(fp.read(), text)
+        # the restored file is the one tomcat was started with
+        self.assertEqual(recipe.changed, [])
+
+    def test_option_changed(self):
+        recipe = self.update(http_port='8081')
+        self.assertIn(self.server_xml, recipe.changed)
+        self.assertTrue(recipe.restart_needed)
+        with open(self.server_xml) as fp:
+            self.assertIn('port="8081"', fp.read())
+
+    def test_template_changed(self):
+        templates = os.path.join(self.tmpdir, 'templates')
+        os.makedirs(templates)
+        template = os.path.join(templates, 'server.xml')
+
+        def write_template(comment, mtime):
+            with open(os.path.join(tomcat.TEMPLATES, 'server.xml')) as fp:
+                text = fp.read()
+            with open(template, 'w') as fp:
+                fp.write('<!-- {0} -->\n'.format(comment) + text)
+            os.utime(template, (mtime, mtime))
+
+        write_template('A', 1000)
+        recipe = self.update(**{'template-directories': templates})
+        self.assertEqual(recipe.changed, [self.server_xml])
+        # a template of the same size is rendered again if its modification time changed
+        write_template('B', 2000)
+        recipe = self.update(**{'template-directories': templates})
+        self.assertEqual(recipe.changed, [self.server_xml])
+        self.assertTrue(recipe.restart_needed)
+        with open(self.server_xml) as fp:
+            self.assertTrue(fp.read().startswith('<!-- B -->'))
+
+
+class ResourcesTestCase(RecipeTestCase):
+
+    BASE = 'jdbc/catalog url=jdbc:postgresql://db/catalog driver=org.postgresql.Driver username=catalog'
+
+    def resources(self, *lines):
+        return self.make_recipe(resources='\n'.join(lines)).resources
+
+    def test_defaults(self):
+        resource, = self.resources(self.BASE)
+        self.assertEqual(resource['name'], 'jdbc/catalog')
+        self.assertEqual(resource['driver'], 'org.postgresql.Driver')
+        attributes = dict(resource['attributes'])
+        self.assertEqual(attributes['maxActive'], '100')
+        self.assertEqual(attributes['maxIdle'], '100')
+        self.assertEqual(attributes['minIdle'], '10')
+        self.assertEqual(attributes['validationQuery'], 'SELECT 1')
+        self.assertEqual(attributes['testWhileIdle'], 'true')
+        self.assertNotIn('password', attributes)
+
+    def test_accepted(self):
+        resources = self.resources(
+            '',
+            self.BASE + ' password=s3c=ret max-active=20 min-idle=0 initial-size=5',
+            '  jdbc/oracle url=jdbc:oracle:thin:@db:1521:orcl driver=oracle.jdbc.OracleDriver username=scott '
+            'validation-query="SELECT 1 FROM DUAL" test-on-borrow=false max-wait=-1')
+        self.assertEqual([resource['name'] for resource in resources], ['jdbc/catalog', 'jdbc/oracle'])
+        catalog, oracle = [dict(resource['attributes']) for resource in resources]
+        self.assertEqual(catalog['password'], 's3c=ret')
+        self.assertEqual(catalog['maxIdle'], '20')
+        self.assertEqual(oracle['validationQuery'], 'SELECT 1 FROM DUAL')
+        self.assertEqual(oracle['testOnBorrow'], 'false')
+        self.assertEqual(oracle['maxWait'], '-1')
+
+    def test_rejected(self):
+        for line in ('jdbc/x "unclosed',
+                     'jdbc/x url=jdbc:x driver=a username',
+                     'jdbc/x url=jdbc:x driver=a',
+                     'jdbc/x url=jdbc:x username=b',
+                     'jdbc/x url=http://db driver=a username=b',
+                     'jdbc/x url=jdbc:x driver=a username=b pool=c3p0',
+                     'jdbc/x url=jdbc:x driver=a username=b max-active=lots',
+                     'jdbc/x url=jdbc:x driver=a username=b min-idle=20 max-idle=10',
+                     'jdbc/x url=jdbc:x driver=a username=b max-idle=200',
+                     'jdbc/x url=jdbc:x driver=a username=b initial-size=200',
+                     'jdbc/x url=jdbc:x driver=a username=b min-idle=-1',
+                     'jdbc/x url=jdbc:x driver=a username=b test-while-idle=yes',
+                     'jdbc/x url=jdbc:x driver=a username=b validation-query=""'):
+            self.assertRaises(zc.buildout.UserError, self.resources, line)
+
+    def test_duplicate(self):
+        self.assertRaises(zc.buildout.UserError, self.resources, self.BASE, self.BASE)
+
+
+class WebappsTestCase(RecipeTestCase):
+
+    def test_conda_package_spec(self):
+        recipe = self.make_recipe(webapps='thredds=4.6 birdhouse::ncwms2>=2.0 /srv/geoserver.war')
+        self.assertEqual([webapp['name'] for webapp in recipe.webapps], ['thredds', 'ncwms2', 'geoserver'])
+        self.assertEqual(recipe.webapps[0]['warfile'], os.path.join(CondaStub.prefix, 'webapps', 'thredds.war'))
+        self.assertEqual(recipe.webapps[2]['warfile'], '/srv/geoserver.war')
+        self.assertIn('thredds=4.6', recipe.conda.options['pkgs'])
+
+    def test_precompile_jsp_once(self):
+        # fake java recording its calls and writing a class into the -d folder of JspC
+        calls = os.path.join(self.tmpdir, 'calls')
+        java = os.path.join(CondaStub.prefix, 'bin', 'java')
+        os.makedirs(os.path.dirname(java))
+        with open(java, 'w') as fp:
+            fp.write('#!/bin/sh\necho "$@" >> {0}\n'
+                     'while [ "$1" != "-d" ]; do shift; done\n'
+                     'mkdir -p "$2/org/apache/jsp" && touch "$2/org/apache/jsp/index_jsp.class"\n'.format(calls))
+        os.chmod(java, 0o755)
+        os.makedirs(os.path.join(CondaStub.prefix, 'webapps'))
+        with zipfile.ZipFile(os.path.join(CondaStub.prefix, 'webapps', 'app.war'), 'w') as zf:
+            zf.writestr('index.jsp', 'hello')
+
+        logging.disable(logging.INFO)
+        try:
+            recipe = self.make_recipe(webapps='app', instances='2', **{'precompile-jsp': 'true'})
+            recipe.install()
+            # an unchanged WAR is not compiled again
+            recipe.install_webapps()
+        finally:
+            logging.disable(logging.NOTSET)
+        with open(calls) as fp:
+            self.assertEqual(len([line for line in fp if 'JspC' in line]), 1)
+        for instance in recipe.instances:
+            self.assertTrue(os.path.isfile(os.path.join(instance['catalina_base'], 'work', 'Catalina', 'localhost',
+                                                        'app', 'org', 'apache', 'jsp', 'index_jsp.class')))
+
+
+class GracefulStopTestCase(RecipeTestCase):
+
+    def test_defaults(self):
+        recipe = self.make_recipe()
+        self.assertEqual(recipe.options['bind-on-init'], 'false')
+        server_xml = recipe.render('server.xml', jdbc_resources=[], **recipe.instances[0])
+        self.assertIn('gracefulStopAwaitMillis="30000"', server_xml)
+        self.assertEqual(server_xml.count('" bindOnInit="false"'), 2)
+
+    def test_timeout_ordering(self):
+        self.make_recipe(**{'stop-timeout': '31', 'graceful-stop-timeout': '30'})
+        self.assertRaises(zc.buildout.UserError, self.make_recipe,
+                          **{'stop-timeout': '30', 'graceful-stop-timeout': '30'})
+        self.assertRaises(zc.buildout.UserError, self.make_recipe,
+                          **{'stop-timeout': '10', 'graceful-stop-timeout': '20'})
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, **{'stop-timeout': '0'})
+
+    def test_health_check_url(self):
+        recipe = self.make_recipe(instances='2', **{'health-check-url': 'http://localhost:{http_port}/thredds/'})
+        self.assertEqual([instance['health_check_url'] for instance in recipe.instances],
+                         ['http://localhost:8080/thredds/', 'http://localhost:8090/thredds/'])
+        for url in ('http://localhost:{port}/', 'http://localhost:{0}/', 'http://localhost:{http_port/'):
+            self.assertRaises(zc.buildout.UserError, self.make_recipe, **{'health-check-url': url})
+
+    def test_restart_script(self):
+        recipe = self.make_recipe(instances='2')
+        recipe.load_digests()
+        logging.disable(logging.INFO)
+        try:
+            path, = recipe.install_restart_script()
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(path, os.path.join(self.tmpdir, 'bin', 'tomcat-restart'))
+        self.assertTrue(os.access(path, os.X_OK))
+        with open(path) as fp:
+            text = fp.read()
+        self.assertIn('PROGRAMS="tomcat-1 tomcat-2"', text)
+        self.assertIn('    tomcat-1) url="http://127.0.0.1:8080/" ;;', text)
+        self.assertIn('    tomcat-2) url="http://127.0.0.1:8090/" ;;', text)
+        self.assertIn('SUPERVISORCTL="{0}"'.format(os.path.join(self.tmpdir, 'bin', 'supervisorctl')), text)
+
+
+class ConnectorTestCase(RecipeTestCase):
+
+    def connectors(self, recipe):
+        server_xml = recipe.render('server.xml', jdbc_resources=[], **recipe.instances[0])
+        return dict((connector.get('protocol'), connector.attrib)
+                    for connector in ElementTree.fromstring(server_xml).iter('Connector'))
+
+    def test_protocol_names(self):
+        for protocol, expected in (('nio', 'org.apache.coyote.http11.Http11NioProtocol'),
+                                   ('NIO2', 'org.apache.coyote.http11.Http11Nio2Protocol'),
+                                   ('apr', 'org.apache.coyote.http11.Http11AprProtocol'),
+                                   ('HTTP/1.1', 'HTTP/1.1'),
+                                   ('org.example.CustomProtocol', 'org.example.CustomProtocol')):
+            recipe = self.make_recipe(protocol=protocol)
+            self.assertEqual(recipe.options['protocol'], expected)
+            self.assertIn(expected, self.connectors(recipe))
+
+    def test_unknown_protocol(self):
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, protocol='bio')
+
+    def test_spare_threads_exceed_max_threads(self):
+        self.make_recipe(**{'max-threads': '20', 'min-spare-threads': '20'})
+        self.assertRaises(zc.buildout.UserError, self.make_recipe,
+                          **{'max-threads': '20', 'min-spare-threads': '21'})
+
+    def test_executor(self):
+        connectors = self.connectors(self.make_recipe(executor='true', **{'max-threads': '300'}))
+        for protocol in ('HTTP/1.1', 'AJP/1.3'):
+            self.assertEqual(connectors[protocol]['executor'], 'tomcatThreadPool')
+            self.assertNotIn('maxThreads', connectors[protocol])
+        connectors = self.connectors(self.make_recipe(**{'max-threads': '300'}))
+        self.assertNotIn('executor', connectors['HTTP/1.1'])
+        self.assertEqual(connectors['HTTP/1.1']['maxThreads'], '300')
+
+
+class ClusterTestCase(RecipeTestCase):
+
+    nodes = 'jvm3 node2.example.org 8080 8009\n\njvm4 node2.example.org 8090 8019'
+
+    def test_cluster_nodes(self):
+        recipe = self.make_recipe(cluster='true', **{'cluster-nodes': self.nodes})
+        self.assertEqual([node['jvm_route'] for node in recipe.cluster_nodes], ['jvm3', 'jvm4'])
+        self.assertEqual(recipe.cluster_nodes[1],
+                         {'jvm_route': 'jvm4', 'host': 'node2.example.org', 'http_port': '8090', 'ajp_port': '8019'})
+
+    def test_bad_cluster_nodes(self):
+        for nodes in ('jvm3 node2.example.org 8080', 'jvm3 node2.example.org http ajp'):
+            self.assertRaises(zc.buildout.UserError, self.make_recipe, cluster='true', **{'cluster-nodes': nodes})
+
+    def test_jvm_route(self):
+        recipe = self.make_recipe(cluster='true', instances='2')
+        for number, instance in enumerate(recipe.instances, 1):
+            server_xml = recipe.render('server.xml', jdbc_resources=[], **instance)
+            engine = ElementTree.fromstring(server_xml).find('Service/Engine')
+            self.assertEqual(engine.get('jvmRoute'), 'jvm{0}'.format(number))
+
+    def test_balancer(self):
+        recipe = self.make_recipe(cluster='true', instances='2', **{'cluster-nodes': self.nodes})
+        workers = recipe.render('workers.properties', nodes=recipe.balancer_nodes())
+        self.assertIn('worker.loadbalancer.balance_workers=jvm1,jvm2,jvm3,jvm4\n', workers)
+        self.assertIn('worker.jvm2.port=8019\n', workers)
+        self.assertIn('worker.jvm3.host=node2.example.org\n', workers)
+        upstream = recipe.render('nginx-upstream.conf', nodes=recipe.balancer_nodes())
+        self.assertEqual([line.split()[1] for line in upstream.splitlines() if line.strip().startswith('server ')],
+                         ['localhost:8080;', 'localhost:8090;', 'node2.example.org:8080;', 'node2.example.org:8090;'])
+
+
+class MonitoringTestCase(RecipeTestCase):
+
+    def test_jmx_password_file(self):
+        logging.disable(logging.INFO)
+        try:
+            self.make_recipe(jmx='true', instances='2', **{'jmx-password': 'secret'}).install()
+        finally:
+            logging.disable(logging.NOTSET)
+        for number in (1, 2):
+            path = os.path.join(self.prefix, 'var', 'lib', 'tomcat', 'instance-{0}'.format(number), 'conf',
+                                'jmxremote.password')
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+            with open(path) as fp:
+                self.assertIn('secret', fp.read())
+
+
+class TLSTestCase(RecipeTestCase):
+
+    def setUp(self):
+        RecipeTestCase.setUp(self)
+        self.tls = {'https': 'true',
+                    'ssl-certificate': os.path.join(self.tmpdir, 'cert.pem'),
+                    'ssl-certificate-key': os.path.join(self.tmpdir, 'key.pem')}
+        for key in ('ssl-certificate', 'ssl-certificate-key'):
+            open(self.tls[key], 'w').close()
+
+    def test_certificate_required(self):
+        for key in ('ssl-certificate', 'ssl-certificate-key'):
+            options = dict(self.tls)
+            del options[key]
+            self.assertRaises(zc.buildout.UserError, self.make_recipe, **options)
+
+    def test_unknown_protocol(self):
+        self.assertRaises(zc.buildout.UserError, self.make_recipe, **dict(self.tls, **{'https-protocol': 'bio'}))
+
+    def test_tcnative(self):
+        recipe = self.make_recipe(**self.tls)
+        self.assertRaises(zc.buildout.UserError, recipe.check_tls)
+        lib = os.path.join(recipe.options['conda-prefix'], 'lib')
+        os.makedirs(lib)
+        open(os.path.join(lib, 'libtcnative-1.so'), 'w').close()
+        logging.disable(logging.INFO)
+        try:
+            recipe.check_tls()
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def test_http2(self):
+        for http2, count in (('false', 0), ('true', 1)):
+            recipe = self.make_recipe(http2=http2, **self.tls)
+            server_xml = recipe.render('server.xml', jdbc_resources=[], **recipe.instances[0])
+            self.assertEqual(len(list(ElementTree.fromstring(server_xml).iter('UpgradeProtocol'))), count)
+
+
+class JarScanTestCase(RecipeTestCase):
+
+    def test_patterns_added_to_defaults(self):
+        recipe = self.make_recipe(**{'jar-scan-skip': 'netcdf*.jar,grib*.jar', 'jar-scan-scan': 'jstl*.jar'})
+        context_xml = recipe.render('context.xml', jdbc_resources=[], **recipe.instances[0])
+        jar_scan_filter = ElementTree.fromstring(context_xml).find('JarScanner/JarScanFilter')
+        for attribute in ('tldSkip', 'pluggabilitySkip'):
+            self.assertEqual(jar_scan_filter.get(attribute),
+                             '${tomcat.util.scan.StandardJarScanFilter.jarsToSkip},netcdf*.jar,grib*.jar')
+        for attribute in ('tldScan', 'pluggabilityScan'):
+            self.assertEqual(jar_scan_filter.get(attribute),
+                             '${tomcat.util.scan.StandardJarScanFilter.jarsToScan},jstl*.jar')
+
+    def test_no_patterns(self):
+        context_xml = self.make_recipe().render('context.xml', jdbc_resources=[])
+        self.assertIsNone(ElementTree.fromstring(context_xml).find('JarScanner/JarScanFilter'))
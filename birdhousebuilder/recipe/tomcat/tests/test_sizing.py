@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the auto-size mode of 'birdhousebuilder.recipe.tomcat'.
+"""
+
+import unittest
+
+from birdhousebuilder.recipe.tomcat import sizing
+
+
+def host(cpus, memory_mb, open_files_max):
+    return {'cpus': cpus, 'memory': memory_mb * sizing.MB, 'memory_source': 'cgroup memory limit',
+            'open_files': 1024, 'open_files_max': open_files_max}
+
+
+class AutoSizeTestCase(unittest.TestCase):
+
+    def test_small_host(self):
+        values, notes = sizing.auto_size(host(4, 8192, 4096))
+        self.assertEqual(values['Xmx'], '4915m')
+        self.assertEqual(values['max-threads'], '200')
+        self.assertEqual(values['min-spare-threads'], '20')
+        self.assertEqual(values['max-connections'], '3072')
+        self.assertEqual(values['ulimit-nofile'], '4096')
+        self.assertEqual(len(notes), 7)
+
+    def test_large_host_shared_by_instances(self):
+        values, _ = sizing.auto_size(host(64, 262144, None), instances=4)
+        self.assertEqual(values['Xmx'], '39321m')
+        self.assertEqual(values['max-threads'], '800')
+        self.assertEqual(values['max-connections'], '10000')
+        self.assertEqual(values['ulimit-nofile'], '11024')
+
+    def test_partial_override(self):
+        values, notes = sizing.auto_size(host(64, 262144, None), given={'Xmx': '2g', 'max-threads': '5'})
+        self.assertNotIn('Xmx', values)
+        self.assertEqual(values['Xms'], '512m')
+        self.assertNotIn('max-threads', values)
+        self.assertEqual(values['min-spare-threads'], '5')
+        self.assertIn('Xmx 2g: given in the buildout', notes)
+
+    def test_given_max_connections(self):
+        values, _ = sizing.auto_size(host(4, 8192, 65536), given={'max-connections': '2000'})
+        self.assertNotIn('max-connections', values)
+        self.assertEqual(values['ulimit-nofile'], '3024')
+        values, _ = sizing.auto_size(host(4, 8192, 4096), given={'max-connections': '8000'})
+        self.assertEqual(values['ulimit-nofile'], '4096')
+
+    def test_given_ulimit_nofile(self):
+        values, _ = sizing.auto_size(host(4, 8192, 65536), given={'ulimit-nofile': '3000'})
+        self.assertNotIn('ulimit-nofile', values)
+        self.assertEqual(values['max-connections'], '1976')
+        values, _ = sizing.auto_size(host(4, 8192, None), given={'ulimit-nofile': '1100'})
+        self.assertEqual(values['max-connections'], '200')
+
+    def test_small_given_heap(self):
+        values, _ = sizing.auto_size(host(4, 8192, 4096), given={'Xmx': '100m'})
+        self.assertEqual(values['Xms'], '100m')
+
+    def test_given_initial_heap(self):
+        values, _ = sizing.auto_size(host(4, 1024, 4096), given={'Xms': '2g'})
+        self.assertEqual(values['Xmx'], '2048m')
+        self.assertNotIn('Xms', values)
+
+    def test_size_mb(self):
+        for value, expected in (('2g', 2048), ('512m', 512), ('1048576k', 1024), (str(3 * sizing.MB), 3),
+                                ('2G', 2048), ('lots', None)):
+            self.assertEqual(sizing.size_mb(value), expected)
+
+    def test_unknown_memory(self):
+        values, _ = sizing.auto_size({'cpus': 1, 'memory': None, 'memory_source': None,
+                                      'open_files': None, 'open_files_max': None})
+        self.assertNotIn('Xmx', values)
+        self.assertEqual(values['max-threads'], '50')
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the startup report of 'birdhousebuilder.recipe.tomcat'.
+"""
+
+import unittest
+
+from birdhousebuilder.recipe.tomcat import startup
+
+LOG = """\
+17-Oct-2016 10:00:00.000 INFO [localhost-startStop-1] org.apache.catalina.startup.HostConfig.deployDescriptor Deploying configuration descriptor [/opt/tomcat/conf/Catalina/localhost/thredds.xml]
+17-Oct-2016 10:00:09.000 INFO [localhost-startStop-1] org.apache.jasper.servlet.TldScanner.scanJars At least one JAR was scanned for TLDs yet contained no TLDs.
+17-Oct-2016 10:00:20.000 INFO [localhost-startStop-1] org.apache.catalina.startup.HostConfig.deployDescriptor Deployment of configuration descriptor [/opt/tomcat/conf/Catalina/localhost/thredds.xml] has finished in [20,123] ms
+17-Oct-2016 10:00:21.000 INFO [localhost-startStop-2] org.apache.catalina.startup.HostConfig.deployDirectory Deployment of web application directory /opt/tomcat/webapps/ROOT has finished in 312 ms
+17-Oct-2016 10:00:21.500 INFO [main] org.apache.catalina.startup.Catalina.start Server startup in 21500 ms
+17-Oct-2016 11:00:10.000 INFO [main] org.apache.catalina.startup.Catalina.start Server startup in [9,876] milliseconds
+""".splitlines()
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        startups = startup.parse(LOG)
+        self.assertEqual(len(startups), 2)
+        self.assertEqual(startups[0]['startup'], 21500)
+        self.assertEqual(startups[0]['webapps'], {'thredds': 20123, 'ROOT': 312})
+        self.assertEqual(startups[0]['no_tlds'], 1)
+        self.assertEqual(startups[1], {'startup': 9876, 'webapps': {}, 'no_tlds': 0})
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the template lookup of 'birdhousebuilder.recipe.tomcat'.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from birdhousebuilder.recipe import tomcat
+
+
+class TemplateLookupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmpdir, 'cache')
+        self.default = os.path.join(self.tmpdir, 'default')
+        self.override = os.path.join(self.tmpdir, 'override')
+        for directory, text in ((self.default, 'default ${name}'), (self.override, 'override ${name}')):
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'server.xml'), 'w') as fp:
+                fp.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        tomcat._lookups.clear()
+
+    def render(self, directories):
+        lookup = tomcat.template_lookup(directories, self.cache)
+        return lookup.get_template('server.xml').render(name='tomcat')
+
+    def test_override_not_reused(self):
+        self.assertEqual(self.render([self.override, self.default]), 'override tomcat')
+        # a new recipe run without the override directory
+        tomcat._lookups.clear()
+        self.assertEqual(self.render([self.default]), 'default tomcat')
+
+    def test_older_template_recompiled(self):
+        self.assertEqual(self.render([self.default]), 'default tomcat')
+        # a template replaced by an older file, i.e. extracted from an archive
+        with open(os.path.join(self.default, 'server.xml'), 'w') as fp:
+            fp.write('changed ${name}')
+        os.utime(os.path.join(self.default, 'server.xml'), (1000, 1000))
+        tomcat._lookups.clear()
+        self.assertEqual(self.render([self.default]), 'changed tomcat')
+
+    def test_compiled_modules_cached(self):
+        self.render([self.default])
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+        self.render([self.override, self.default])
+        self.assertEqual(len(os.listdir(self.cache)), 2)
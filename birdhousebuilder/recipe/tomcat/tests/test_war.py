@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the WAR extraction of 'birdhousebuilder.recipe.tomcat'.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import zc.buildout
+
+from birdhousebuilder.recipe.tomcat import unzip
+from birdhousebuilder.recipe.tomcat import war
+
+
+class UnzipTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.warfile = os.path.join(self.tmpdir, 'app.war')
+        self.webapp = os.path.join(self.tmpdir, 'webapps', 'app')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_war(self, entries):
+        with zipfile.ZipFile(self.warfile, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in entries.items():
+                zf.writestr(name, data)
+
+    def test_extract(self):
+        self.write_war({'index.jsp': 'hello', 'WEB-INF/web.xml': '<web-app/>'})
+        written, removed = unzip(self.tmpdir, self.warfile)
+        self.assertEqual(sorted(written), ['WEB-INF/web.xml', 'index.jsp'])
+        self.assertEqual(removed, [])
+        with open(os.path.join(self.webapp, 'index.jsp')) as fp:
+            self.assertEqual(fp.read(), 'hello')
+
+    def test_extract_changed_only(self):
+        self.write_war({'index.jsp': 'hello', 'old.jsp': 'old', 'WEB-INF/web.xml': '<web-app/>'})
+        unzip(self.tmpdir, self.warfile)
+        self.write_war({'index.jsp': 'hello world', 'WEB-INF/web.xml': '<web-app/>'})
+        written, removed = unzip(self.tmpdir, self.warfile)
+        self.assertEqual(written, ['index.jsp'])
+        self.assertEqual(removed, ['old.jsp'])
+        self.assertFalse(os.path.exists(os.path.join(self.webapp, 'old.jsp')))
+
+    def test_extract_parallel(self):
+        self.write_war(dict(('page{0}.jsp'.format(i), str(i)) for i in range(war.PARALLEL_THRESHOLD)))
+        written, _ = unzip(self.tmpdir, self.warfile, workers=4)
+        self.assertEqual(len(written), war.PARALLEL_THRESHOLD)
+        with open(os.path.join(self.webapp, 'page7.jsp')) as fp:
+            self.assertEqual(fp.read(), '7')
+
+    def test_bad_war(self):
+        with open(self.warfile, 'w') as fp:
+            fp.write('no zip')
+        self.assertRaises(zc.buildout.UserError, unzip, self.tmpdir, self.warfile)
+
+    def test_entry_outside_webapp(self):
+        self.write_war({'../evil.jsp': 'evil'})
+        self.assertRaises(zc.buildout.UserError, unzip, self.tmpdir, self.warfile)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of WAR files into the tomcat webapps folder.
+
+A manifest with the CRC and size of each extracted entry is kept in the webapp folder
+so that on a redeploy only the changed entries are written.
+"""
+
+import os
+import json
+import shutil
+import zipfile
+import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import zc.buildout
+
+logger = logging.getLogger(__name__)
+
+# META-INF is never served by tomcat
+MANIFEST = os.path.join('META-INF', 'birdhouse-manifest.json')
+BUFSIZE = 64 * 1024
+# below this number of changed entries a thread pool does not pay off
+PARALLEL_THRESHOLD = 256
+
+
+def target_path(dirpath, name):
+    path = os.path.normpath(os.path.join(dirpath, name))
+    if not path.startswith(os.path.normpath(dirpath) + os.sep):
+        raise zc.buildout.UserError("WAR entry {0!r} points outside of {1}".format(name, dirpath))
+    return path
+
+
+def load_manifest(dirpath):
+    try:
+        with open(os.path.join(dirpath, MANIFEST)) as fp:
+            return json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_manifest(dirpath, manifest):
+    path = os.path.join(dirpath, MANIFEST)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as fp:
+        json.dump(manifest, fp, sort_keys=True)
+
+
+def extract_members(warfile, dirpath, names):
+    """Streams the given entries of warfile to disk. Each call uses its own zip file handle."""
+    with zipfile.ZipFile(warfile) as zf:
+        for name in names:
+            path = target_path(dirpath, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # created by another worker
+                    if not os.path.isdir(os.path.dirname(path)):
+                        raise
+            src = zf.open(name)
+            try:
+                with open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, BUFSIZE)
+            finally:
+                src.close()
+    return len(names)
+
+
+def extract_war(warfile, dirpath, workers=None):
+    """Extracts warfile into dirpath writing only entries changed since the last extraction.
+
+    Returns the lists of written and removed entries.
+    """
+    try:
+        with zipfile.ZipFile(warfile) as zf:
+            infos = zf.infolist()
+    except (IOError, OSError, zipfile.BadZipfile) as err:
+        raise zc.buildout.UserError("Could not read WAR file {0}: {1}".format(warfile, err))
+
+    previous = load_manifest(dirpath)
+    manifest = {}
+    changed = []
+    for info in infos:
+        path = target_path(dirpath, info.filename)
+        if info.filename.endswith('/'):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            continue
+        manifest[info.filename] = [info.CRC, info.file_size]
+        if previous.get(info.filename) == manifest[info.filename] \
+                and os.path.isfile(path) and os.path.getsize(path) == info.file_size:
+            continue
+        changed.append(info)
+    removed = [name for name in previous if name not in manifest]
+    for name in removed:
+        path = target_path(dirpath, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    # largest entries first to balance the workers
+    changed.sort(key=lambda info: info.file_size, reverse=True)
+    names = [info.filename for info in changed]
+    workers = workers or min(4, multiprocessing.cpu_count())
+    try:
+        if workers > 1 and len(names) >= PARALLEL_THRESHOLD:
+            pool = ThreadPool(workers)
+            try:
+                pool.map(lambda chunk: extract_members(warfile, dirpath, chunk),
+                         [names[i::workers] for i in range(workers)])
+            finally:
+                pool.close()
+                pool.join()
+        elif names:
+            extract_members(warfile, dirpath, names)
+    except (IOError, zipfile.BadZipfile) as err:
+        raise zc.buildout.UserError("Could not extract WAR file {0}: {1}".format(warfile, err))
+    save_manifest(dirpath, manifest)
+    logger.info("Extracted %s: %d entries written, %d removed, %d unchanged",
+                warfile, len(names), len(removed), len(manifest) - len(names))
+    return names, removed
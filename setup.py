@@ -20,6 +20,9 @@ entry_points = '''
 default = %(name)s:Recipe
 [zc.buildout.uninstall]
 default = %(name)s:uninstall
+[console_scripts]
+tomcat-accesslog = %(name)s.accesslog:main
+tomcat-startup = %(name)s.startup:main
 ''' % globals()
 
 reqs = ['setuptools',